@@ -16,8 +16,14 @@
 # Also read the article accompanying this code at ***URL HERE***
 
 from math import sqrt, log
+import multiprocessing
 import random
 import time
+from agents.array_tree import ArrayTree, ArrayNode
+from agents.time_manager import TimeManager
+
+NODE_BYTES = 266 # approximate memory of a Node with its attributes on CPython, in bytes
+EARLY_STOP_INTERVAL = 32 # iterations between two checks of the early stopping of Search
 
 
 class Node:
@@ -114,54 +120,487 @@ class Node:
             s += str(c) + "\n"
         return s
 
-def ISMCTS(rootstate, itermax=100, timed=False, thinking_time=1, verbose=1, consider_points=False):
+def ISMCTS(rootstate, itermax=100, timed=False, thinking_time=1, verbose=1, consider_points=False, batch_rollouts=0,
+           workers=1, pool=None, max_nodes=None, max_bytes=None, prune=False, stats=None, exploration=0.7,
+           evaluator=None, early_stop=False, heuristic_rollouts=False, sampler=None):
     """ Conduct an ISMCTS search for itermax iterations or thinking_time seconds starting from rootstate.
         timed is a boolean that determines whether the search is time-based or iteration-based.
+        exploration is the UCB1 exploration constant, see Node.UCBSelectChild.
+        evaluator replaces the rollouts where it can, see Search.
+        If early_stop is True, the search stops as soon as the best move is decided, see Search.
+        If heuristic_rollouts is True, the rollouts follow the policy of the state, see Search.
+        sampler hands out the determinizations, see Search.
+        If workers > 1 or a pool is given, the search is root-parallel over workers processes: see ParallelSearch.
+        max_nodes, max_bytes, prune and stats bound the memory of the search tree, see Search
+        (in a root-parallel search the bounds apply to every worker and stats is not filled).
         Return the best move from the rootstate.
     """
 
-    rootnode = Node()
+    if workers > 1 or pool is not None:
+        rootnode = ParallelSearch(rootstate, itermax, timed, thinking_time, consider_points, batch_rollouts,
+                                  workers if workers > 1 else None, pool, max_nodes, max_bytes, prune, exploration, evaluator,
+                                  early_stop, heuristic_rollouts, sampler)
+    else:
+        rootnode = Search(rootstate, itermax, timed, thinking_time, consider_points, batch_rollouts,
+                          max_nodes=max_nodes, max_bytes=max_bytes, prune=prune, stats=stats, exploration=exploration,
+                          evaluator=evaluator, early_stop=early_stop, heuristic_rollouts=heuristic_rollouts,
+                          sampler=sampler)
+
+    # Output some information about the tree - can be omitted
+    if verbose == 2:
+        print(rootnode.TreeToString(0))
+    elif verbose == 1:
+        print(rootnode.ChildrenToString())
+
+    return BestMove(rootnode, rootstate)
+
+def BestMove(rootnode, rootstate):
+    """ Return the most visited move of the root. If the root has no child, because the memory bounds of the
+        search do not leave room for them (see Search), return a random legal move of rootstate instead.
+    """
+    if not rootnode.childNodes:
+        return random.choice(rootstate.GetMoves())
+    return max(rootnode.childNodes, key=lambda c: c.visits).move
+
+def CountNodes(rootnode):
+    """ Return the number of nodes in the tree below rootnode, rootnode included.
+    """
+    if isinstance(rootnode, ArrayNode):
+        return rootnode.tree.count
+    count = 0
+    stack = [rootnode]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.childNodes)
+    return count
+
+def GetTreeBytes(rootnode, nodeCount):
+    """ Return the memory used by the tree of rootnode, which holds nodeCount nodes, in bytes
+        (exact for an ArrayTree, estimated with NODE_BYTES for a tree of Node objects).
+    """
+    if isinstance(rootnode, ArrayNode):
+        return rootnode.tree.GetBytes()
+    return nodeCount * NODE_BYTES
+
+def PruneTree(rootnode, keep):
+    """ Discard the least visited subtrees of the tree of rootnode, so that about keep nodes are left.
+        The children of the root are always kept, so that the best move is still available.
+        Return the root of the pruned tree.
+    """
+    if isinstance(rootnode, ArrayNode):
+        tree = rootnode.tree
+        visits = sorted(tree.visits[:tree.count], reverse=True)
+    else:
+        visits = []
+        stack = [rootnode]
+        while stack:
+            node = stack.pop()
+            visits.append(node.visits)
+            stack.extend(node.childNodes)
+        visits.sort(reverse=True)
+    if keep >= len(visits):
+        return rootnode
+    minVisits = visits[keep] + 1 # the nodes with as many visits as the first discarded one go too
+
+    if isinstance(rootnode, ArrayNode):
+        return rootnode.tree.Extract(rootnode.index, minVisits).Root()
+    stack = list(rootnode.childNodes)
+    while stack:
+        node = stack.pop()
+        node.childNodes = [c for c in node.childNodes if c.visits >= minVisits]
+        stack.extend(node.childNodes)
+    return rootnode
+
+def Search(rootstate, itermax=100, timed=False, thinking_time=1, consider_points=False, batch_rollouts=0, rootnode=None,
+           max_nodes=None, max_bytes=None, prune=False, stats=None, exploration=0.7, evaluator=None, early_stop=False,
+           heuristic_rollouts=False, sampler=None):
+    """ Run the ISMCTS iterations for ISMCTS and return the root node of the search tree.
+        If rootnode is given, the search continues growing that tree, which must have been built for rootstate.
+        If rootstate supports UndoMove, a single scratch state is randomized in place at every iteration
+        and the moves are undone afterwards, instead of cloning rootstate every time.
+        If rootstate provides DoRandomRollout, it is used for the simulation step; if heuristic_rollouts is True
+        and rootstate provides DoHeuristicRollout, that is used instead (see BriscolaState.DoHeuristicRollout).
+        If sampler is given, the determinizations are taken from it instead of shuffling the hidden cards at every
+        iteration: sampler.Sync(rootstate) is called first, then sampler.Randomize(state) on a copy of rootstate
+        (see determinization.DeterminizationPool, which can be kept across moves).
+        If batch_rollouts > 0 and rootstate provides DoBatchRollout, every leaf is evaluated with the average
+        of batch_rollouts rollouts played together. Only the rollouts of a leaf are vectorized, not the leaves, and
+        the NumPy setup of every batch costs about as much as 80 scalar rollouts: below about 64 rollouts per leaf
+        a batch is slower per rollout than DoRandomRollout (7k against 11k rollouts/s at 32). In a 2 player
+        search, 32 rollouts per leaf give about 6k simulations/s but 190 iterations/s, against 5k iterations/s
+        with scalar rollouts; the batches pay off only in the thousands (80k simulations/s at 4096, in 20
+        iterations/s). The tree then grows by one node per batch, so use them when accurate leaf values matter
+        more than the size of the tree (see the "ISMCTS batch rollouts" benchmarks of benchmarks/suite.py).
+        If rootstate provides GetMoveId, the tree is an ArrayTree instead of a tree of Node objects.
+        The tree holds at most max_nodes nodes and max_bytes bytes (see GetTreeBytes), if they are given.
+        When it is full, the search stops expanding it and goes on with the rollouts from its leaves or,
+        if prune is True, the least visited subtrees are discarded to make room (see PruneTree).
+        The root is always expanded, so the budget should leave room for its children; with a smaller one the
+        root may have no children, and ISMCTS and ISMCTSAgent then play a random legal move (see BestMove).
+        exploration is the UCB1 exploration constant.
+        If evaluator is given, it is called with the state reached by every iteration and if it returns a result
+        (an object with GetResult, like the terminal state) that is used instead of a rollout, e.g. the
+        exact value of an endgame (see endgame.EndgameSolver). If it returns None, the rollout is played.
+        If early_stop is True, the search stops after the first iteration when only one move is legal, and
+        otherwise every EARLY_STOP_INTERVAL iterations as soon as the second most visited child of the root cannot
+        overtake the most visited one in the iterations left (estimated from the speed so far if timed).
+        If stats is a dict, it is filled with the statistics of the search (there is no overhead if it is None):
+        "iterations", "time" and "iterations_per_second";
+        "phases", {phase: {"time": seconds, "calls": count}} for determinize, select (one call per UCB selection),
+        expand, simulate and backpropagate (one call per node updated, the undo of the moves included);
+        "nodes", "peak_nodes", "peak_bytes" and "prunes" for the size of the tree;
+        "max_depth" of the leaves reached, "avg_rollout_length" in moves and "root_visits", {str(move): visits};
+        "stopped_early", True if early_stop ended the search.
+    """
+
+    bounded = max_nodes is not None or max_bytes is not None
+    if rootnode is not None:
+        pass
+    elif hasattr(rootstate, "GetMoveId"):
+        rootnode = ArrayTree(rootstate.GetMoveId, rootstate.GetMoveFromId, maxNodes=max_nodes, maxBytes=max_bytes).Root()
+    else:
+        rootnode = Node()
+    arrayTree = isinstance(rootnode, ArrayNode)
+    if arrayTree:
+        rootnode.tree.maxNodes, rootnode.tree.maxBytes = max_nodes, max_bytes
+    nodeCount = CountNodes(rootnode) if bounded or stats is not None else 0
+    peakNodes = nodeCount
+    peakBytes = GetTreeBytes(rootnode, nodeCount)
+    prunes = 0
+    full = False
+    profile = stats is not None
+    if profile:
+        clock = time.perf_counter
+        phaseTimes = {"determinize": 0.0, "select": 0.0, "expand": 0.0, "simulate": 0.0, "backpropagate": 0.0}
+        phaseCalls = dict.fromkeys(phaseTimes, 0)
+        iterations, maxDepth, rolloutMoves, rollouts = 0, 0, 0, 0
     start_time = time.time()
 
+    undoable = hasattr(rootstate, "UndoMove")
+    fastRollout = hasattr(rootstate, "DoRandomRollout")
+    heuristicRollout = heuristic_rollouts and hasattr(rootstate, "DoHeuristicRollout")
+    batchRollout = batch_rollouts > 0 and hasattr(rootstate, "DoBatchRollout")
+    if undoable:
+        state = rootstate.Clone()
+        undos = []
+    if sampler is not None:
+        sampler.Sync(rootstate)
+    forced = early_stop and len(rootstate.GetMoves()) == 1
+    stoppedEarly = False
+    done = 0
+
     while (not timed and itermax > 0) or (timed and time.time() - start_time < thinking_time):
         itermax -= 1
         node = rootnode
+        if profile:
+            t0 = clock()
 
         # Determinize
-        state = rootstate.CloneAndRandomize(rootstate.playerToMove)
+        if sampler is not None:
+            if not undoable:
+                state = rootstate.Clone()
+            sampler.Randomize(state)
+        elif undoable:
+            state.Randomize(rootstate.playerToMove)
+        else:
+            state = rootstate.CloneAndRandomize(rootstate.playerToMove)
+        if profile:
+            t1 = clock()
+            depth = 0
 
         # Select
         while (
             state.GetMoves() != [] and node.GetUntriedMoves(state.GetMoves()) == []
         ):  # node is fully expanded and non-terminal
-            node = node.UCBSelectChild(state.GetMoves())
-            state.DoMove(node.move)
+            node = node.UCBSelectChild(state.GetMoves(), exploration)
+            undo = state.DoMove(node.move)
+            if undoable:
+                undos.append(undo)
+            if profile:
+                depth += 1
+        if profile:
+            t2 = clock()
+            phaseCalls["select"] += depth
 
         # Expand
         untriedMoves = node.GetUntriedMoves(state.GetMoves())
-        if untriedMoves != []:  # if we can expand (i.e. state/node is non-terminal)
+        if untriedMoves != [] and (not full or node == rootnode):  # if we can expand (i.e. state/node is non-terminal)
             m = random.choice(untriedMoves)
             player = state.playerToMove
-            state.DoMove(m)
-            node = node.AddChild(m, player)  # add child and descend tree
+            child = node.AddChild(m, player)  # add child and descend tree
+            if child is None: # the ArrayTree reached its bounds
+                full = True
+            else:
+                undo = state.DoMove(m)
+                if undoable:
+                    undos.append(undo)
+                node = child
+                if profile:
+                    depth += 1
+                    phaseCalls["expand"] += 1
+                if bounded or stats is not None:
+                    nodeCount = rootnode.tree.count if arrayTree else nodeCount + 1
+                    peakNodes = max(peakNodes, nodeCount)
+                    if not arrayTree:
+                        full = bounded and ((max_nodes is not None and nodeCount >= max_nodes)
+                                            or (max_bytes is not None and nodeCount * NODE_BYTES >= max_bytes))
+
+        if profile:
+            t3 = clock()
 
         # Simulate
-        while state.GetMoves() != []:  # while state is non-terminal
-            state.DoMove(random.choice(state.GetMoves()))
+        rolloutLength = 0
+        terminalState = evaluator(state) if evaluator is not None else None
+        if terminalState is not None:
+            pass
+        elif batchRollout:
+            terminalState = state.DoBatchRollout(batch_rollouts)
+        elif heuristicRollout:
+            terminalState = state.DoHeuristicRollout(random)
+        elif fastRollout:
+            terminalState = state.DoRandomRollout(random)
+        else:
+            moves = state.GetMoves()
+            while moves != []:  # while state is non-terminal
+                undo = state.DoMove(random.choice(moves))
+                if undoable:
+                    undos.append(undo)
+                moves = state.GetMoves()
+                rolloutLength += 1
+            terminalState = state
+        if profile:
+            t4 = clock()
+            updates = 0
 
         # Backpropagate
         while (
             node != None
         ):  # backpropagate from the expanded node and work back to the root node
-            node.Update(state, consider_points=consider_points)
+            node.Update(terminalState, consider_points=consider_points)
             node = node.parentNode
+            if profile:
+                updates += 1
 
-    # Output some information about the tree - can be omitted
-    if verbose == 2:
-        print(rootnode.TreeToString(0))
-    elif verbose == 1:
-        print(rootnode.ChildrenToString())
+        # Bring the scratch state back to the root position
+        if undoable:
+            while undos:
+                state.UndoMove(undos.pop())
+
+        if profile:
+            t5 = clock()
+            phaseTimes["determinize"] += t1 - t0
+            phaseTimes["select"] += t2 - t1
+            phaseTimes["expand"] += t3 - t2
+            phaseTimes["simulate"] += t4 - t3
+            phaseTimes["backpropagate"] += t5 - t4
+            phaseCalls["determinize"] += 1
+            phaseCalls["simulate"] += 1
+            phaseCalls["backpropagate"] += updates
+            iterations += 1
+            maxDepth = max(maxDepth, depth)
+            rolloutMoves += getattr(terminalState, "length", rolloutLength)
+            rollouts += 1
+
+        # Make room in a full tree
+        if full and prune:
+            peakBytes = max(peakBytes, GetTreeBytes(rootnode, nodeCount))
+            limit = min(max_nodes if max_nodes is not None else nodeCount,
+                        max_bytes // NODE_BYTES if max_bytes is not None and not arrayTree else nodeCount)
+            rootnode = PruneTree(rootnode, limit // 2)
+            nodeCount = CountNodes(rootnode)
+            prunes += 1
+            # keep searching without expanding if pruning cannot free enough room
+            full = nodeCount >= limit
+            prune = not full
+
+        # Stop when the most visited move is decided
+        done += 1
+        if forced or (early_stop and done % EARLY_STOP_INTERVAL == 0):
+            if forced:
+                stoppedEarly = True
+                break
+            if timed:
+                elapsed = time.time() - start_time
+                remaining = done / elapsed * (thinking_time - elapsed) if elapsed > 0 else float("inf")
+            else:
+                remaining = itermax
+            visits = sorted((c.visits for c in rootnode.childNodes), reverse=True) + [0, 0]
+            if visits[0] - visits[1] > remaining:
+                stoppedEarly = True
+                break
+
+    if profile:
+        elapsed = time.time() - start_time
+        stats["iterations"] = iterations
+        stats["time"] = elapsed
+        stats["iterations_per_second"] = iterations / elapsed if elapsed > 0 else 0.0
+        stats["phases"] = {phase: {"time": phaseTimes[phase], "calls": phaseCalls[phase]} for phase in phaseTimes}
+        stats["nodes"] = nodeCount
+        stats["peak_nodes"] = peakNodes
+        stats["peak_bytes"] = max(peakBytes, GetTreeBytes(rootnode, nodeCount))
+        stats["prunes"] = prunes
+        stats["max_depth"] = maxDepth
+        stats["avg_rollout_length"] = rolloutMoves / rollouts if rollouts else 0.0
+        stats["root_visits"] = {str(c.move): c.visits for c in rootnode.childNodes}
+        stats["stopped_early"] = stoppedEarly
+
+    return rootnode
+
+def SearchWorker(args):
+    """ Run Search in a worker process with its own random seed.
+        Return the statistics of the root children as a list of (move, playerJustMoved, wins, visits, avails).
+    """
+    seed, searchArgs = args
+    random.seed(seed)
+    sampler = searchArgs[-1]
+    if sampler is not None:
+        sampler.Seed(seed) # the copies of the sampler must not hand out the same determinizations
+    rootnode = Search(*searchArgs)
+    return [(c.move, c.playerJustMoved, c.wins, c.visits, c.avails) for c in rootnode.childNodes]
+
+def ParallelSearch(rootstate, itermax=100, timed=False, thinking_time=1, consider_points=False, batch_rollouts=0,
+                   workers=None, pool=None, max_nodes=None, max_bytes=None, prune=False, exploration=0.7, evaluator=None,
+                   early_stop=False, heuristic_rollouts=False, sampler=None):
+    """ Root-parallel ISMCTS: every worker process builds its own tree from independent determinizations of
+        rootstate and the statistics of the root children are summed.
+        itermax is split between the workers, while each worker searches for thinking_time seconds if timed.
+        pool is a multiprocessing.Pool or concurrent.futures.ProcessPoolExecutor to reuse across moves,
+        otherwise a pool is created for this search. workers defaults to the number of cores.
+        max_nodes, max_bytes, prune, exploration, evaluator, early_stop, heuristic_rollouts and sampler are passed
+        to the Search of every worker (a copy of sampler, which is not updated).
+        Return a root node whose children hold the merged statistics.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    # independent random streams, derived from the random module so that seeding it makes the search reproducible
+    seeds = [random.getrandbits(64) for _ in range(workers)]
+    iters = [itermax // workers + (1 if w < itermax % workers else 0) for w in range(workers)]
+    args = [(seeds[w], (rootstate, iters[w], timed, thinking_time, consider_points, batch_rollouts, None,
+                        max_nodes, max_bytes, prune, None, exploration, evaluator, early_stop,
+                        heuristic_rollouts, sampler)) for w in range(workers)]
+
+    if pool is None:
+        with multiprocessing.Pool(workers) as p:
+            results = p.map(SearchWorker, args)
+    else:
+        results = list(pool.map(SearchWorker, args))
+
+    rootnode = Node()
+    for stats in results:
+        for move, player, wins, visits, avails in stats:
+            child = next((c for c in rootnode.childNodes if c.move == move), None)
+            if child is None:
+                child = rootnode.AddChild(move, player)
+                child.avails = 0
+            child.wins += wins
+            child.visits += visits
+            child.avails += avails
+            rootnode.visits += visits
+
+    return rootnode
+
+
+class ISMCTSAgent:
+    """ An ISMCTS player that keeps its search tree between its moves.
+        Call it with the state like the other agents. Before searching, it advances the root of its tree
+        along the moves played since its previous decision (its own and the other players') and
+        discards the rest of the tree, so the visits already gathered below the new root are reused.
+        The state must provide GetMoveHistory(), otherwise the tree is rebuilt at every move.
+        A tree is only reused by the player it was searched for, whose hand it was built with: an agent playing
+        several seats (e.g. both players of a team) keeps one tree per seat.
+        If count_reused is True, itermax is the total number of visits of the root, reused ones included.
+        max_nodes, max_bytes and prune bound the memory of the tree, see Search.
+        If collect_stats is True, the statistics of the last search (see Search) are kept in stats.
+        evaluator replaces the rollouts where it can, see Search.
+        If game_time is given, the search is timed and the agent spreads game_time seconds over its moves of a game
+        with a TimeManager, stopping every search early when its move is decided; thinking_time is then ignored.
+        early_stop can also be set on its own, and heuristic_rollouts selects the rollout policy, see Search.
+        sampler hands out the determinizations of the searches (see Search); a determinization.DeterminizationPool
+        is kept by the agent across its moves and games.
+    """
+
+    def __init__(self, itermax=100, timed=False, thinking_time=1, verbose=0, consider_points=False, batch_rollouts=0,
+                 count_reused=False, max_nodes=None, max_bytes=None, prune=False, exploration=0.7, collect_stats=False,
+                 evaluator=None, early_stop=False, game_time=None, heuristic_rollouts=False,
+                 sampler=None):
+        self.itermax = itermax
+        self.timed = timed
+        self.thinking_time = thinking_time
+        self.verbose = verbose
+        self.consider_points = consider_points
+        self.batch_rollouts = batch_rollouts
+        self.count_reused = count_reused
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.prune = prune
+        self.exploration = exploration
+        self.collect_stats = collect_stats
+        self.evaluator = evaluator
+        self.early_stop = early_stop or game_time is not None
+        self.clock = TimeManager(game_time) if game_time is not None else None
+        self.heuristic_rollouts = heuristic_rollouts
+        self.sampler = sampler
+        self.stats = None
+        self.rootnode = None
+        self.history = [] # moves played before the current root
+        self.player = None # player the current tree was searched for
+        self.trees = {} # player: (rootnode, history) of the other seats played by the agent
+
+    def __call__(self, state):
+        self.Advance(state)
+
+        itermax = self.itermax
+        if self.count_reused and self.rootnode is not None:
+            itermax = max(itermax - self.rootnode.visits, 0)
+        self.stats = {} if self.collect_stats else None
+        search = lambda thinking_time: Search(state, itermax, self.timed or self.clock is not None, thinking_time,
+                                              self.consider_points, self.batch_rollouts, self.rootnode, self.max_nodes,
+                                              self.max_bytes, self.prune, self.stats, self.exploration, self.evaluator,
+                                              self.early_stop, self.heuristic_rollouts, self.sampler)
+        if self.clock is not None:
+            self.rootnode = self.clock.Think(search, state)
+        else:
+            self.rootnode = search(self.thinking_time)
+
+        if self.verbose == 2:
+            print(self.rootnode.TreeToString(0))
+        elif self.verbose == 1:
+            print(self.rootnode.ChildrenToString())
+
+        return BestMove(self.rootnode, state)
+
+    def Advance(self, state):
+        """ Move the root of the tree to the node reached by the moves played since the previous call.
+            The tree is discarded if it does not match state (e.g. a new game has started), and the tree of the
+            player to move is taken out if the agent last searched for another seat.
+        """
+        player = getattr(state, "playerToMove", None)
+        if player != self.player:
+            if self.player is not None:
+                self.trees[self.player] = (self.rootnode, self.history)
+            self.rootnode, self.history = self.trees.pop(player, (None, []))
+            self.player = player
+        if not hasattr(state, "GetMoveHistory"):
+            self.rootnode = None
+            return
+        history = state.GetMoveHistory()
+
+        node = self.rootnode
+        if node is None or history[:len(self.history)] != self.history:
+            node = None
+        else:
+            for move in history[len(self.history):]:
+                node = next((c for c in node.childNodes if c.move == move), None)
+                if node is None:
+                    break
+        self.history = history
 
-    return max(
-        rootnode.childNodes, key=lambda c: c.visits
-    ).move  # return the move that was most visited
+        if node is None:
+            self.rootnode = None
+        elif isinstance(node, ArrayNode):
+            self.rootnode = node.tree.Extract(node.index).Root()
+        else:
+            node.parentNode = None
+            self.rootnode = node
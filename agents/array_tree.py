@@ -0,0 +1,277 @@
+""" A compact ISMCTS search tree stored as a struct of arrays.
+    Every node is an index into typed arrays (visits, wins, avails, player, move id, parent). A node
+    with children owns a block of moveCount entries of the children array, indexed by the integer id
+    of the move (see GameState.GetMoveId); leaves, most of the tree, do not need one. ArrayNode gives the same interface as ISMCTS.Node, so the search loop
+    and the debugging output (TreeToString / ChildrenToString) work with both trees.
+"""
+from math import sqrt, log
+from array import array
+
+
+class ArrayTree:
+    """ A search tree stored as a struct of arrays. Node 0 is the root.
+        The child of node i for the move id m is children[block[i] * moveCount + m] (-1 if there is none),
+        where block[i] is -1 until the first child of i is added.
+        The arrays are preallocated for capacity nodes and doubled when they are full, but never beyond
+        maxNodes nodes or maxBytes bytes (if given): then no more nodes can be added. maxBytes is split
+        between the node arrays and the children blocks assuming one block every 4 nodes.
+        moveId / moveFromId convert the moves to integers in range(moveCount) and back.
+    """
+
+    NODE_BYTES = 26 # bytes per node in the node arrays (without the children blocks)
+
+    def __init__(self, moveId, moveFromId, moveCount=40, capacity=1024, maxNodes=None, maxBytes=None):
+        self.moveId = moveId
+        self.moveFromId = moveFromId
+        self.moveCount = moveCount
+        self.maxNodes = maxNodes
+        self.maxBytes = maxBytes
+        self.capacity = 0
+        self.count = 0
+        self.blockCapacity = 0
+        self.blockCount = 0
+        self.visits = array("i")
+        self.wins = array("d")
+        self.avails = array("i")
+        self.player = array("b")    # playerJustMoved, 0 for the root
+        self.move = array("b")      # move id (moveCount must be at most 127), -1 for the root
+        self.parent = array("i")    # -1 for the root
+        self.block = array("i")     # block of the children array, -1 for a leaf
+        self.children = array("i")  # -1 where there is no child
+        if maxNodes is not None:
+            capacity = min(capacity, maxNodes)
+        self.Grow(capacity)
+        self.GrowBlocks(max(1, capacity // 4))
+        self.NewNode(-1, -1, 0)
+
+    def Grow(self, capacity):
+        """ Extend the node arrays to hold capacity nodes, or as many as maxNodes and maxBytes allow.
+            Return False if the tree cannot grow.
+        """
+        if self.maxNodes is not None:
+            capacity = min(capacity, self.maxNodes)
+        if self.maxBytes is not None:
+            capacity = min(capacity, self.GetNodeBytesShare() // ArrayTree.NODE_BYTES)
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return self.count < self.capacity
+        self.visits.extend(array("i", [0]) * extra)
+        self.wins.extend(array("d", [0.0]) * extra)
+        self.avails.extend(array("i", [0]) * extra)
+        self.player.extend(array("b", [0]) * extra)
+        self.move.extend(array("b", [0]) * extra)
+        self.parent.extend(array("i", [0]) * extra)
+        self.block.extend(array("i", [-1]) * extra)
+        self.capacity = capacity
+        return True
+
+    def GrowBlocks(self, capacity):
+        """ Extend the children array to hold capacity blocks, or as many as maxNodes and maxBytes allow.
+            Return False if the tree cannot grow.
+        """
+        if self.maxNodes is not None:
+            capacity = min(capacity, self.maxNodes)
+        if self.maxBytes is not None:
+            capacity = min(capacity, (self.maxBytes - self.GetNodeBytesShare()) // (4 * self.moveCount))
+        extra = capacity - self.blockCapacity
+        if extra <= 0:
+            return self.blockCount < self.blockCapacity
+        self.children.extend(array("i", [-1]) * (extra * self.moveCount))
+        self.blockCapacity = capacity
+        return True
+
+    def GetNodeBytesShare(self):
+        """ Return the part of maxBytes available to the node arrays.
+        """
+        return self.maxBytes * ArrayTree.NODE_BYTES // (ArrayTree.NODE_BYTES + self.moveCount)
+
+    def NewNode(self, m, parent, p):
+        """ Add a node for the move id m, child of parent, and return its index.
+            Return -1 if the tree cannot grow.
+        """
+        i = self.count
+        if i >= self.capacity and not self.Grow(2 * self.capacity):
+            return -1
+        if parent >= 0 and self.block[parent] < 0:
+            b = self.blockCount
+            if b >= self.blockCapacity and not self.GrowBlocks(2 * self.blockCapacity):
+                return -1
+            self.block[parent] = b
+            self.blockCount = b + 1
+        self.visits[i] = 0
+        self.wins[i] = 0.0
+        self.avails[i] = 1
+        self.player[i] = p
+        self.move[i] = m
+        self.parent[i] = parent
+        self.block[i] = -1
+        if parent >= 0:
+            self.children[self.block[parent] * self.moveCount + m] = i
+        self.count = i + 1
+        return i
+
+    def GetChild(self, i, m):
+        """ Return the child of node i for the move id m, or -1.
+        """
+        b = self.block[i]
+        return -1 if b < 0 else self.children[b * self.moveCount + m]
+
+    def Extract(self, i, minVisits=0):
+        """ Return a new ArrayTree holding a copy of the subtree of node i, with i as its root.
+            Below the children of i, the nodes visited less than minVisits times are left out with their subtrees.
+            The new tree has the same maxNodes and maxBytes.
+        """
+        tree = ArrayTree(self.moveId, self.moveFromId, self.moveCount, maxNodes=self.maxNodes, maxBytes=self.maxBytes)
+        tree.player[0], tree.move[0] = self.player[i], self.move[i]
+        queue = [(i, 0)]
+        while queue:
+            old, new = queue.pop()
+            tree.visits[new], tree.wins[new], tree.avails[new] = self.visits[old], self.wins[old], self.avails[old]
+            b = self.block[old]
+            if b >= 0:
+                for c in self.children[b * self.moveCount:(b + 1) * self.moveCount]:
+                    if c >= 0 and (old == i or self.visits[c] >= minVisits):
+                        queue.append((c, tree.NewNode(self.move[c], new, self.player[c])))
+        return tree
+
+    def Root(self):
+        """ Return the root node.
+        """
+        return ArrayNode(self, 0)
+
+    def GetBytes(self):
+        """ Return the memory used by the arrays, in bytes.
+        """
+        return sum(a.itemsize * len(a) for a in
+                   (self.visits, self.wins, self.avails, self.player, self.move, self.parent, self.block, self.children))
+
+
+class ArrayNode:
+    """ A node of an ArrayTree, with the same interface as ISMCTS.Node.
+        Note wins is always from the viewpoint of playerJustMoved.
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def move(self):
+        m = self.tree.move[self.index]
+        return None if m < 0 else self.tree.moveFromId(m)
+
+    @property
+    def parentNode(self):
+        parent = self.tree.parent[self.index]
+        return None if parent < 0 else ArrayNode(self.tree, parent)
+
+    @property
+    def childNodes(self):
+        tree = self.tree
+        b = tree.block[self.index]
+        if b < 0:
+            return []
+        return [ArrayNode(tree, c) for c in tree.children[b * tree.moveCount:(b + 1) * tree.moveCount] if c >= 0]
+
+    @property
+    def playerJustMoved(self):
+        return self.tree.player[self.index] or None
+
+    @property
+    def wins(self):
+        return self.tree.wins[self.index]
+
+    @property
+    def visits(self):
+        return self.tree.visits[self.index]
+
+    @property
+    def avails(self):
+        return self.tree.avails[self.index]
+
+    def GetUntriedMoves(self, legalMoves):
+        """ Return the elements of legalMoves for which this node does not have children.
+        """
+        tree = self.tree
+        b = tree.block[self.index]
+        if b < 0:
+            return list(legalMoves)
+        base = b * tree.moveCount
+        children = tree.children
+        return [move for move in legalMoves if children[base + tree.moveId(move)] < 0]
+
+    def UCBSelectChild(self, legalMoves, exploration=0.7):
+        """ Use the UCB1 formula to select a child node, filtered by the given list of legal moves:
+            the argmax of the UCB score over the children of the legal move ids.
+        """
+        tree = self.tree
+        base = tree.block[self.index] * tree.moveCount
+        children, visits, wins, avails = tree.children, tree.visits, tree.wins, tree.avails
+
+        best, bestScore = -1, None
+        for move in legalMoves:
+            c = children[base + tree.moveId(move)]
+            # Update availability counts -- it is easier to do this now than during backpropagation
+            avails[c] += 1
+            n = visits[c]
+            score = wins[c] / n + exploration * sqrt(log(avails[c] - 1) / n)
+            if bestScore is None or score > bestScore:
+                best, bestScore = c, score
+
+        return ArrayNode(tree, best)
+
+    def AddChild(self, m, p):
+        """ Add a new child node for the move m.
+            Return the added child node, or None if the tree is full.
+        """
+        tree = self.tree
+        i = tree.NewNode(tree.moveId(m), self.index, p)
+        return None if i < 0 else ArrayNode(tree, i)
+
+    def Update(self, terminalState, consider_points=True):
+        """ Update this node - increment the visit count by one, and increase the win count by the result of terminalState for self.playerJustMoved.
+        """
+        tree = self.tree
+        i = self.index
+        tree.visits[i] += 1
+        if tree.player[i]:
+            score = terminalState.GetResult(tree.player[i], get_points=consider_points)
+            if(consider_points):
+                score = float(score) / 60.0
+            tree.wins[i] += score
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayNode) and self.tree is other.tree and self.index == other.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "[M:%s W/V/A|E: %4.2f/%4i/%4i|%4.2f]" % (
+            self.move,
+            self.wins,
+            self.visits,
+            self.avails,
+            self.wins / self.visits if self.visits > 0 else 0,
+        )
+
+    def TreeToString(self, indent):
+        """ Represent the tree as a string, for debugging purposes.
+        """
+        s = self.IndentString(indent) + str(self)
+        for c in self.childNodes:
+            s += c.TreeToString(indent + 1)
+        return s
+
+    def IndentString(self, indent):
+        s = "\n"
+        for i in range(1, indent + 1):
+            s += "| "
+        return s
+
+    def ChildrenToString(self):
+        s = ""
+        for c in self.childNodes:
+            s += str(c) + "\n"
+        return s
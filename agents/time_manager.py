@@ -0,0 +1,63 @@
+""" Thinking time management for a whole game.
+    A player gets game_time seconds for all its moves. The budget left is spread over the moves the player
+    still has to make, weighting every move by the number of cards hidden from the player at that point of the
+    game, so the early moves, where most of the cards are hidden, get more time than the last ones.
+    The last move of the game is forced and gets only the minimum time, which a search with early stopping
+    does not even use (see ISMCTS.Search).
+"""
+import time
+
+
+class TimeManager:
+    """ The clock of one player, see the module documentation.
+        Allocate returns the thinking time of the next move and Update charges the time actually spent.
+        The clock is reset when a new game starts (fewer cards played than at the previous move).
+        Every move gets at least min_time seconds, even if the budget is exhausted.
+    """
+
+    def __init__(self, game_time, min_time=0.01):
+        self.game_time = game_time
+        self.min_time = min_time
+        self.Reset()
+
+    def Reset(self):
+        self.remaining = self.game_time
+        self.played = -1 # cards played at the previous move
+
+    def GetWeights(self, state):
+        """ Return the weights of the moves left to the player to move in state, the current one first:
+            the number of cards hidden from the player at every one of its future moves (0 for the forced last move).
+        """
+        n = state.numberOfPlayers
+        trick = len(state.history) // n
+        weights = []
+        for t in range(trick, 40 // n):
+            # before trick t the player has seen its 3 cards, the last card and about n cards per trick
+            hidden = 40 - 4 - n * t - (len(state.history) % n if t == trick else 0)
+            weights.append(max(hidden, 1) if t < 40 // n - 1 else 0)
+        return weights
+
+    def Allocate(self, state):
+        """ Return the thinking time in seconds of the player to move in state.
+        """
+        if len(state.history) < self.played:
+            self.Reset()
+        self.played = len(state.history)
+        weights = self.GetWeights(state)
+        if len(state.GetMoves()) <= 1 or not weights[0]:
+            return self.min_time
+        return max(self.remaining * weights[0] / sum(weights), self.min_time)
+
+    def Update(self, elapsed):
+        """ Charge elapsed seconds to the clock.
+        """
+        self.remaining = max(self.remaining - elapsed, 0.0)
+
+    def Think(self, search, state):
+        """ Call search(thinking_time) with the time allocated to state and charge the time it takes.
+            Return the result of search.
+        """
+        start_time = time.time()
+        result = search(self.Allocate(state))
+        self.Update(time.time() - start_time)
+        return result
@@ -0,0 +1,300 @@
+""" Tree-parallel ISMCTS.
+    Several worker processes grow a single search tree stored in shared memory (see SharedTree).
+    Virtual loss keeps the workers from all descending the same path, and the statistics of every
+    node are updated under one of a set of striped locks. Without locks, every worker updates its own
+    copy of the statistics (visits, virtual losses, wins and avails) and the selection sums the copies,
+    so no update is lost.
+"""
+from math import sqrt, log
+from array import array
+from multiprocessing import shared_memory
+import multiprocessing
+import random
+import time
+from agents.ISMCTS import Node
+from agents.array_tree import ArrayTree
+
+
+class SharedTree(ArrayTree):
+    """ An ArrayTree whose arrays live in shared memory, so that several processes can grow it.
+        It cannot grow beyond the capacity it is created with. Besides the ArrayTree arrays it has
+        virtual, the virtual losses of the searches currently going through each node.
+        The statistics are kept in shards copies: the copy k of the statistics of node i is at index
+        k * capacity + i, and the statistics of the node are their sum (see ToNode).
+    """
+
+    # name, typecode and length of the arrays: "node" is one value per node, "stats" one per node and shard,
+    # "children" one per node and move id
+    FIELDS = [
+        ("visits", "i", "stats"),
+        ("virtual", "i", "stats"),
+        ("wins", "d", "stats"),
+        ("avails", "i", "stats"),
+        ("player", "b", "node"),
+        ("move", "b", "node"),
+        ("parent", "i", "node"),
+        ("block", "i", "node"),
+        ("children", "i", "children"),
+        ("counter", "q", "counters"),  # number of nodes and of children blocks allocated
+    ]
+
+    def __init__(self, capacity, moveId, moveFromId, moveCount=40, names=None, shards=1):
+        """ Create the shared arrays for capacity nodes, or attach to the arrays of another
+            SharedTree if names (its GetNames()) is given.
+        """
+        self.moveId = moveId
+        self.moveFromId = moveFromId
+        self.moveCount = moveCount
+        self.capacity = capacity
+        self.blockCapacity = capacity
+        self.shards = shards
+        self.owner = names is None
+        self.blocks = {}
+        lengths = {"node": capacity, "stats": capacity * shards, "children": capacity * moveCount, "counters": 2}
+        for name, typecode, length in SharedTree.FIELDS:
+            length = lengths[length]
+            if self.owner:
+                block = shared_memory.SharedMemory(create=True, size=length * array(typecode).itemsize)
+            else:
+                block = shared_memory.SharedMemory(name=names[name])
+            self.blocks[name] = block
+            setattr(self, name, block.buf.cast(typecode)[:length])
+
+        if self.owner:
+            self.children[:] = array("i", [-1]) * len(self.children)
+            self.counter[0] = 0
+            self.counter[1] = 0
+            self.NewNode(-1, -1, 0)
+
+    @property
+    def count(self):
+        return self.counter[0]
+
+    @count.setter
+    def count(self, value):
+        self.counter[0] = value
+
+    @property
+    def blockCount(self):
+        return self.counter[1]
+
+    @blockCount.setter
+    def blockCount(self, value):
+        self.counter[1] = value
+
+    def Grow(self, capacity):
+        return capacity <= self.capacity
+
+    def GrowBlocks(self, capacity):
+        return capacity <= self.blockCapacity
+
+    def GetNames(self):
+        """ Return the names of the shared memory blocks, to attach to the tree from another process.
+        """
+        return {name: block.name for name, block in self.blocks.items()}
+
+    def Close(self):
+        """ Release the shared memory (and destroy it if this is the process that created it).
+        """
+        for name, _, _ in SharedTree.FIELDS:
+            getattr(self, name).release()
+            delattr(self, name)
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+    def AddChild(self, i, m, p):
+        """ Return the child of node i for the move id m, allocating it for player p who just moved
+            if it does not exist yet. Must be called holding the allocation lock.
+            Return -1 if the tree is full.
+            The virtual losses of a new node are 0, as the shared memory is created zeroed and nodes are never
+            reused: they are not written here, since other workers may already go through the new node.
+        """
+        child = self.GetChild(i, m)
+        if child >= 0:
+            return child
+        return self.NewNode(m, i, p)
+
+    def ToNode(self, i, depth=1):
+        """ Copy node i and its descendants down to depth into a tree of Node objects.
+        """
+        node = Node(move=None if self.move[i] < 0 else self.moveFromId(self.move[i]),
+                    playerJustMoved=self.player[i] or None)
+        shards = range(i, self.shards * self.capacity, self.capacity)
+        node.wins = sum(self.wins[k] for k in shards)
+        node.visits = sum(self.visits[k] for k in shards)
+        node.avails = sum(self.avails[k] for k in shards)
+        if depth > 0 and self.block[i] >= 0:
+            base = self.block[i] * self.moveCount
+            for j in self.children[base:base + self.moveCount]:
+                if j >= 0:
+                    child = self.ToNode(j, depth - 1)
+                    child.parentNode = node
+                    node.childNodes.append(child)
+        return node
+
+
+def TreeWorker(names, capacity, shards, locks, allocLock, rootstate, itermax, deadline,
+               consider_points, exploration, virtual_loss, seed, shard):
+    """ Run ISMCTS iterations on the shared tree until itermax iterations are done or until deadline
+        (a time.time() value), if it is not None.
+        Without locks, the worker updates the copy shard of the statistics (see SharedTree).
+    """
+    random.seed(seed)
+    tree = SharedTree(capacity, rootstate.GetMoveId, rootstate.GetMoveFromId, names=names, shards=shards)
+    visits, virtual, wins, avails, player, block, children = \
+        tree.visits, tree.virtual, tree.wins, tree.avails, tree.player, tree.block, tree.children
+    moveCount = tree.moveCount
+    lossValue = -1.0 if consider_points else 0.0 # result of a virtual loss
+    nlocks = len(locks)
+    offset = shard * capacity # index of the statistics updated by this worker
+    copies = range(0, shards * capacity, capacity)
+    state = rootstate.Clone()
+    observer = rootstate.playerToMove
+    undos = []
+    path = []
+
+    while (deadline is None and itermax > 0) or (deadline is not None and time.time() < deadline):
+        itermax -= 1
+        node = 0
+        path.append(0)
+
+        # Determinize
+        state.Randomize(observer)
+
+        # Select and expand
+        moves = state.GetMoves()
+        while moves != []:
+            ids = [state.GetMoveId(m) for m in moves]
+            base = block[node] * moveCount
+            untried = ids if base < 0 else [m for m in ids if children[base + m] < 0]
+            if untried != []:
+                m = random.choice(untried)
+                with allocLock:
+                    child = tree.AddChild(node, m, state.playerToMove)
+                if child >= 0:
+                    # the virtual losses of a node are always updated under its striped lock
+                    if locks:
+                        with locks[child % nlocks]:
+                            virtual[child] += 1
+                    else:
+                        virtual[offset + child] += 1
+                    undos.append(state.DoMove(state.GetMoveFromId(m)))
+                    path.append(child)
+                break
+
+            # UCB1, counting every virtual loss as virtual_loss visits with a losing result
+            # avails of the children are protected by the lock of the parent
+            lock = locks[node % nlocks] if locks else None
+            if lock:
+                lock.acquire()
+            best, bestScore = -1, None
+            for m in ids:
+                c = children[base + m]
+                if locks:
+                    v, lost, won, availed = visits[c], virtual[c], wins[c], avails[c]
+                else:
+                    v = sum(visits[k + c] for k in copies)
+                    lost = sum(virtual[k + c] for k in copies)
+                    won = sum(wins[k + c] for k in copies)
+                    availed = sum(avails[k + c] for k in copies)
+                n = max(v + virtual_loss * lost, 1)
+                score = (won + virtual_loss * lost * lossValue) / n + exploration * sqrt(log(max(availed, 1)) / n)
+                avails[offset + c] += 1
+                if bestScore is None or score > bestScore:
+                    best, bestScore = c, score
+            if lock:
+                lock.release()
+
+            node = best
+            if locks:
+                with locks[node % nlocks]:
+                    virtual[node] += 1
+            else:
+                virtual[offset + node] += 1
+            path.append(node)
+            undos.append(state.DoMove(state.GetMoveFromId(tree.move[node])))
+            moves = state.GetMoves()
+
+        # Simulate
+        terminalState = state.DoRandomRollout(random)
+
+        # Backpropagate
+        for i in path:
+            lock = locks[i % nlocks] if locks else None
+            if lock:
+                lock.acquire()
+            visits[offset + i] += 1
+            if i > 0:
+                virtual[offset + i] -= 1
+                score = terminalState.GetResult(player[i], get_points=consider_points)
+                if consider_points:
+                    score = float(score) / 60.0
+                wins[offset + i] += score
+            if lock:
+                lock.release()
+        path.clear()
+
+        # Bring the scratch state back to the root position
+        while undos:
+            state.UndoMove(undos.pop())
+
+    del visits, virtual, wins, avails, player, block, children
+    tree.Close()
+
+
+def TreeParallelSearch(rootstate, itermax=100, timed=False, thinking_time=1, consider_points=False, workers=None,
+                       capacity=100000, exploration=0.7, virtual_loss=1, lock_free=False, stripes=64):
+    """ Tree-parallel ISMCTS: workers processes grow one shared tree from rootstate.
+        rootstate must support Randomize/UndoMove, DoRandomRollout and GetMoveId/GetMoveFromId.
+        itermax is split between the workers, while each worker searches for thinking_time seconds if timed.
+        The tree holds at most capacity nodes: when it is full the workers stop expanding it.
+        Node statistics are updated under stripes locks or, if lock_free is True, without locks in one copy of the
+        statistics per worker (see SharedTree).
+        Return the root node as a Node whose children hold the statistics of the root children.
+    """
+    # the thinking time includes the setup of the shared tree and of the processes
+    deadline = time.time() + thinking_time if timed else None
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    shards = workers if lock_free else 1
+    tree = SharedTree(capacity, rootstate.GetMoveId, rootstate.GetMoveFromId, shards=shards)
+    locks = [] if lock_free else [multiprocessing.Lock() for _ in range(stripes)]
+    allocLock = multiprocessing.Lock()
+
+    processes = []
+    for w in range(workers):
+        iters = itermax // workers + (1 if w < itermax % workers else 0)
+        args = (tree.GetNames(), capacity, shards, locks, allocLock, rootstate, iters, deadline,
+                consider_points, exploration, virtual_loss, random.getrandbits(64), w if lock_free else 0)
+        proc = multiprocessing.Process(target=TreeWorker, args=args)
+        proc.start()
+        processes.append(proc)
+    for proc in processes:
+        proc.join()
+    for proc in processes:
+        if proc.exitcode != 0:
+            tree.Close()
+            raise Exception(f"Tree-parallel worker failed with exit code {proc.exitcode}")
+
+    rootnode = tree.ToNode(0)
+    rootnode.nodeCount = tree.count
+    tree.Close()
+    return rootnode
+
+
+def TreeParallelISMCTS(rootstate, itermax=100, timed=False, thinking_time=1, verbose=1, consider_points=False,
+                       workers=None, **kwargs):
+    """ Same as ISMCTS.ISMCTS, with a tree-parallel search (see TreeParallelSearch).
+        Return the best move from the rootstate.
+    """
+    rootnode = TreeParallelSearch(rootstate, itermax, timed, thinking_time, consider_points, workers, **kwargs)
+
+    if verbose:
+        print(rootnode.ChildrenToString())
+
+    return max(
+        rootnode.childNodes, key=lambda c: c.visits
+    ).move  # return the move that was most visited
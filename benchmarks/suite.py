@@ -0,0 +1,258 @@
+""" Micro and macro benchmarks of the Briscola engine and of ISMCTS.
+    Every benchmark works on positions generated from a fixed seed. The results are printed and can be
+    saved as JSON with --output; with --baseline they are compared with a previous JSON file and the
+    script exits with status 1 if any benchmark is slower than the baseline by more than --tolerance.
+"""
+import sys
+import os
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import time
+from functools import partial
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import briscola_batch
+import numpy as np
+import agents.ISMCTS as ISMCTS
+from run_experiment import run_experiment
+
+def GetPositions(n, count, seed):
+    """ Return count positions reached by random play from seeded deals.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        random.seed(rng.getrandbits(64))
+        state = briscola.BriscolaState(n)
+        for _ in range(rng.randrange(0, 4 * n)):
+            state.DoMove(rng.choice(state.GetMoves()))
+        positions.append(state)
+    return positions
+
+def TimeCalls(fn, args, repeat):
+    """ Call fn on every element of args, repeat times after a warm-up pass, and return the best time per call
+        in microseconds.
+    """
+    for a in args:
+        fn(a)
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for a in args:
+            fn(a)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(args) * 1e6
+
+
+def BenchGetNewDeck(scale, seed):
+    return TimeCalls(lambda _: briscola.Card.GetNewDeck(), range(1000 * scale), 5)
+
+def BenchClone(scale, seed):
+    return TimeCalls(lambda s: s.Clone(), GetPositions(4, 100, seed) * (10 * scale), 5)
+
+def BenchCloneAndRandomize(scale, seed):
+    random.seed(seed)
+    return TimeCalls(lambda s: s.CloneAndRandomize(s.playerToMove), GetPositions(4, 100, seed) * (10 * scale), 5)
+
+def BenchDoMove(scale, seed):
+    """ Time per DoMove over whole games, replaying moves chosen in advance on fresh clones of the deals.
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(20):
+        deck = list(range(40))
+        rng.shuffle(deck)
+        state = briscola.BriscolaState(4, deck)
+        moves = []
+        replay = state.Clone()
+        while replay.GetMoves() != []:
+            moves.append(rng.choice(replay.GetMoves()))
+            replay.DoMove(moves[-1])
+        games.append((state, moves))
+
+    best = None
+    for _ in range(5):
+        clones = [(state.Clone(), moves) for state, moves in games for _ in range(scale)]
+        count = 0
+        start_time = time.perf_counter()
+        for state, moves in clones:
+            for m in moves:
+                state.DoMove(m)
+            count += len(moves)
+        elapsed = (time.perf_counter() - start_time) / count
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+def BenchDealRound(scale, seed):
+    """ Time per DealRound, dealing whole stocks of fresh clones of the deals.
+    """
+    positions = [s for s in GetPositions(4, 20, seed) if s.stock] * (5 * scale)
+    best = None
+    for _ in range(5):
+        clones = [state.Clone() for state in positions]
+        count = 0
+        start_time = time.perf_counter()
+        for state in clones:
+            while state.stock:
+                state.DealRound()
+                count += 1
+        elapsed = (time.perf_counter() - start_time) / count
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+def BenchComputeWinner(scale, seed):
+    rng = random.Random(seed)
+    state = briscola.BriscolaState(4)
+    state.trick = [(p, p) for p in range(1, 5)] # ComputeWinner requires a full table
+    tables = []
+    for _ in range(1000):
+        cards = rng.sample(briscola.Card.GetNewDeck(), 4)
+        tables.append([(p + 1, c) for p, c in enumerate(cards)])
+    return TimeCalls(state.ComputeWinner, tables * scale, 5)
+
+def BenchSearch(n, scale, seed):
+    """ ISMCTS iterations per second on positions of games with n players.
+    """
+    positions = GetPositions(n, 5, seed)
+    best = None
+    for _ in range(3):
+        random.seed(seed)
+        iterations = 0
+        start_time = time.perf_counter()
+        for state in positions:
+            iterations += ISMCTS.Search(state, itermax=1000 * scale).visits
+        rate = iterations / (time.perf_counter() - start_time)
+        best = rate if best is None else max(best, rate)
+    return best
+
+def BenchBatchRollouts(k, scale, seed):
+    """ Simulations per second of ISMCTS on 2 player positions with batch_rollouts=k, to compare with the
+        iterations per second of the scalar rollouts ("ISMCTS 2 players", one simulation per iteration).
+    """
+    positions = GetPositions(2, 5, seed)
+    best = None
+    for _ in range(3):
+        random.seed(seed)
+        iterations = 0
+        start_time = time.perf_counter()
+        for state in positions:
+            iterations += ISMCTS.Search(state, itermax=max(2000 * scale // k, 4), batch_rollouts=k).visits
+        rate = iterations * k / (time.perf_counter() - start_time)
+        best = rate if best is None else max(best, rate)
+    return best
+
+def BenchGames(scale, seed):
+    """ Full 4 player games per minute through run_experiment, with 50 iterations per move.
+    """
+    agent = partial(ISMCTS.ISMCTS, itermax=50, verbose=0)
+    games = 4 * scale
+    best = None
+    for _ in range(3):
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_experiment({p: agent for p in range(1, 5)}, n_games=games, seed=seed)
+        rate = games / (time.perf_counter() - start_time) * 60
+        best = rate if best is None else max(best, rate)
+    return best
+
+def BenchBatchEnv(scale, seed):
+    """ Positions per second played by BatchEnv with 1024 games of 4 players and random moves.
+    """
+    env = briscola_batch.BatchEnv(1024, 4)
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(3):
+        positions = 0
+        start_time = time.perf_counter()
+        for game in range(scale):
+            env.reset(range(game * 1024, (game + 1) * 1024))
+            while not env.done.all():
+                mask = env.legal_moves_mask()
+                env.step((mask * rng.random(mask.shape)).argmax(axis=1))
+                positions += 1024
+        rate = positions / (time.perf_counter() - start_time)
+        best = rate if best is None else max(best, rate)
+    return best
+
+
+# name: (function(scale, seed), unit, True if higher values are better)
+BENCHMARKS = {
+    "Card.GetNewDeck": (BenchGetNewDeck, "us", False),
+    "BriscolaState.Clone": (BenchClone, "us", False),
+    "BriscolaState.CloneAndRandomize": (BenchCloneAndRandomize, "us", False),
+    "BriscolaState.DoMove": (BenchDoMove, "us", False),
+    "BriscolaState.DealRound": (BenchDealRound, "us", False),
+    "BriscolaState.ComputeWinner": (BenchComputeWinner, "us", False),
+    "ISMCTS 2 players": (partial(BenchSearch, 2), "iterations/s", True),
+    "ISMCTS 4 players": (partial(BenchSearch, 4), "iterations/s", True),
+    "ISMCTS batch rollouts 32": (partial(BenchBatchRollouts, 32), "simulations/s", True),
+    "ISMCTS batch rollouts 1024": (partial(BenchBatchRollouts, 1024), "simulations/s", True),
+    "run_experiment 4 players": (BenchGames, "games/min", True),
+    "BatchEnv 4 players": (BenchBatchEnv, "positions/s", True),
+}
+
+def RunBenchmarks(names, scale=1, seed=0):
+    """ Run the benchmarks in names and return {name: {"value", "unit", "higher_is_better"}}.
+    """
+    results = {}
+    for name in names:
+        fn, unit, higher = BENCHMARKS[name]
+        value = fn(scale, seed)
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher}
+        print(f"{name:>32}: {value:12.2f} {unit}")
+    return results
+
+def Compare(results, baseline, tolerance):
+    """ Return the names of the benchmarks of results worse than in baseline by more than tolerance (a fraction).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        change = (new - old) / old if result["higher_is_better"] else (old - new) / old
+        flag = "REGRESSION" if change < -tolerance else ""
+        print(f"{name:>32}: {old:12.2f} -> {new:12.2f} {result['unit']} ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', type=str, nargs='*', help='benchmarks to run (default:all)', default=None)
+    parser.add_argument('--scale', type=int, help='multiplier of the work done by every benchmark (default:1)', default=1)
+    parser.add_argument('--seed', type=int, help='random seed (default:0)', default=0)
+    parser.add_argument('--output', type=str, help='JSON file to save the results to (default:None)', default=None)
+    parser.add_argument('--baseline', type=str, help='JSON file of previous results to compare with (default:None)', default=None)
+    parser.add_argument('--tolerance', type=float, help='slowdown allowed against the baseline (default:0.15)', default=0.15)
+    args = parser.parse_args()
+
+    names = args.only if args.only else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}, choose among: {', '.join(BENCHMARKS)}")
+
+    results = RunBenchmarks(names, args.scale, args.seed)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "scale": args.scale,
+                       "seed": args.seed, "benchmarks": results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = Compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+""" Compare tree-parallel ISMCTS with the single-process search at equal wall-clock time.
+    For every position both searches get the same thinking time; the script reports the iterations
+    done per second of measured wall-clock time (setup included) and how often each search picks the move
+    of a longer reference search.
+"""
+import sys
+import os
+import argparse
+import random
+import time
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import agents.ISMCTS as ISMCTS
+import agents.tree_parallel as tree_parallel
+
+def GetPositions(n, count, seed):
+    """ Return count positions reached by random play from seeded deals.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        random.seed(rng.getrandbits(64))
+        state = briscola.BriscolaState(n)
+        for _ in range(rng.randrange(0, 4 * n)):
+            state.DoMove(rng.choice(state.GetMoves()))
+        positions.append(state)
+    return positions
+
+def BestMove(rootnode):
+    return max(rootnode.childNodes, key=lambda c: c.visits).move
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, help='number of players (default:2)', default=2, choices=[2, 4])
+    parser.add_argument('--workers', type=int, help='number of processes for the tree-parallel search (default:4)', default=4)
+    parser.add_argument('--time', type=float, help='thinking time per search in seconds (default:1)', default=1.0)
+    parser.add_argument('--positions', type=int, help='number of positions (default:10)', default=10)
+    parser.add_argument('--reference', type=float, help='thinking time of the reference search (default:10 x time)', default=None)
+    parser.add_argument('--seed', type=int, help='random seed (default:0)', default=0)
+    args = parser.parse_args()
+    reference = args.reference if args.reference is not None else 10 * args.time
+
+    totals = {"single": [0, 0, 0.0], "tree": [0, 0, 0.0]} # iterations, agreements with the reference, seconds
+    for i, state in enumerate(GetPositions(args.players, args.positions, args.seed)):
+        random.seed(args.seed + i)
+        best = BestMove(ISMCTS.Search(state, timed=True, thinking_time=reference))
+
+        start_time = time.time()
+        single = ISMCTS.Search(state, timed=True, thinking_time=args.time)
+        singleTime = time.time() - start_time
+        start_time = time.time()
+        tree = tree_parallel.TreeParallelSearch(state, timed=True, thinking_time=args.time, workers=args.workers)
+        treeTime = time.time() - start_time
+        for name, root, elapsed in [("single", single, singleTime), ("tree", tree, treeTime)]:
+            totals[name][0] += root.visits
+            totals[name][1] += BestMove(root) == best
+            totals[name][2] += elapsed
+        print(f"position {i}: single {single.visits} iterations in {singleTime:.2f}s, "
+              f"tree-parallel {tree.visits} iterations in {treeTime:.2f}s")
+
+    for name, (iterations, agree, elapsed) in totals.items():
+        print(f"{name:>6}: {iterations / elapsed:8.0f} iterations/s, {elapsed / args.positions:.2f}s per search, "
+              f"agrees with reference on {agree}/{args.positions} positions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+""" Vectorized Briscola rollouts.
+    Many random games are played at once, one row per simulation: hands, stock order, trump, scores
+    and player to move are NumPy arrays and each step plays one card in every unfinished game.
+    A hand is stored as 3 slots holding card ids, -1 for an empty slot.
+    Tricks are resolved with the same rules as BriscolaState.ComputeWinner.
+    BatchEnv plays whole games in lockstep with the moves chosen by the caller, for bulk self-play.
+"""
+import random
+import numpy as np
+from briscola import CARD_SUITS, CARD_RANKS, CARD_POINTS, MaskToIds, TRICK_WINNER
+
+SUITS = np.array(CARD_SUITS, dtype=np.int8)
+RANKS = np.array(CARD_RANKS, dtype=np.int8)
+POINTS = np.array(CARD_POINTS, dtype=np.int16)
+
+
+class BatchResult:
+    """ The final scores of a batch of rollouts. GetResult averages the result over the batch.
+    """
+    def __init__(self, scores, length=None):
+        self.scores = scores # [rollouts, 2] final scores for the two teams [even, odd]
+        self.length = length # number of moves played by every rollout
+
+    def GetResult(self, player, get_points=True):
+        """ Get the average game result from the viewpoint of player, see BriscolaState.GetResult.
+        """
+        mine = self.scores[:, player % 2]
+        theirs = self.scores[:, (player + 1) % 2]
+        if get_points:
+            return float((mine - theirs).mean())
+        else:
+            return float((mine > theirs).mean())
+
+
+def BatchRollout(states, k=1, rng=None, shuffle_stock=True):
+    """ Play k random rollouts from each BriscolaState in states, all at once.
+        Return a [len(states) * k, 2] array with the final scores, where rows i * k to (i + 1) * k - 1
+        are the rollouts of states[i]. The states are not modified.
+        If shuffle_stock is True, every rollout draws the stock in a different random order.
+        rng is a numpy Generator, by default one is seeded from the random module.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+
+    n = states[0].numberOfPlayers
+    if any(st.numberOfPlayers != n for st in states):
+        raise Exception("All the states of a batch must have the same number of players")
+
+    # one row per state
+    S = len(states)
+    stock = np.zeros((S, 40), dtype=np.int16)
+    stockLen = np.zeros(S, dtype=np.int16)
+    lastCard = np.zeros(S, dtype=np.int16)
+    trump = np.zeros(S, dtype=np.int8)
+    score = np.zeros((S, 2), dtype=np.int16)
+    player = np.zeros(S, dtype=np.int8)
+    starting = np.zeros(S, dtype=np.int8)
+    played = np.zeros(S, dtype=np.int8)
+    winner = np.zeros(S, dtype=np.int8)
+    winnerCard = np.zeros(S, dtype=np.int16)
+    points = np.zeros(S, dtype=np.int16)
+
+    hands = np.full((S, n + 1, 3), -1, dtype=np.int16)
+    for i, st in enumerate(states):
+        for p in range(1, n + 1):
+            cards = MaskToIds(st.handMasks[p])
+            hands[i, p, :len(cards)] = cards
+        stock[i, :len(st.stock)] = st.stock
+        stockLen[i] = len(st.stock)
+        lastCard[i] = st.lastCardId
+        trump[i] = st.trump
+        score[i] = st.score
+        player[i] = st.playerToMove
+        starting[i] = st.playerStarting
+        played[i] = len(st.trick)
+        if st.trick:
+            winner[i], points[i] = st.ComputeTrickWinner(st.trick)
+            winnerCard[i] = [c for p, c in st.trick if p == winner[i]][0]
+
+    # one row per rollout
+    B = S * k
+    hands, stock, stockLen, lastCard, trump, score, player, starting, played, winner, winnerCard, points = [
+        np.repeat(a, k, axis=0)
+        for a in (hands, stock, stockLen, lastCard, trump, score, player, starting, played, winner, winnerCard, points)
+    ]
+    rows = np.arange(B)
+
+    if shuffle_stock:
+        keys = rng.random((B, 40))
+        keys[np.arange(40)[None, :] >= stockLen[:, None]] = 2.0 # keep the unused slots at the end
+        stock = np.take_along_axis(stock, np.argsort(keys, axis=1), axis=1)
+
+    while True:
+        full = hands[rows, player] >= 0
+        count = full.sum(axis=1)
+        active = count > 0
+        if not active.any():
+            break
+
+        # pick a random card from the hand of each player to move
+        pick = (rng.random(B) * count).astype(np.int8) + 1
+        slot = (full & (full.cumsum(axis=1) == pick[:, None])).argmax(axis=1)
+        c = hands[rows, player, slot]
+        hands[rows[active], player[active], slot[active]] = -1
+
+        # update the winner of the trick
+        beats = ((SUITS[c] == trump) & (SUITS[winnerCard] != trump)) \
+            | ((SUITS[c] == SUITS[winnerCard]) & (RANKS[c] > RANKS[winnerCard]))
+        take = active & ((played == 0) | beats)
+        winner = np.where(take, player, winner)
+        winnerCard = np.where(take, c, winnerCard)
+        points = np.where(active, points + POINTS[c], points)
+        played = np.where(active, played + 1, played)
+        player = np.where(active, (player % n) + 1, player)
+
+        #if the table is full, the round is over
+        done = active & (played == n)
+        if not done.any():
+            continue
+        score[rows[done], winner[done] % 2] += points[done]
+        starting = np.where(done, winner, starting)
+        player = np.where(done, winner, player)
+        played[done] = 0
+        points[done] = 0
+
+        # deal the cards to the players, the closing player gets the last card on the last deal
+        deal = done & (stockLen > 0)
+        if not deal.any():
+            continue
+        closing = ((starting - 2) % n) + 1
+        lastDeal = stockLen + 1 == n
+        for p in range(1, n + 1):
+            empty = (hands[:, p] < 0).argmax(axis=1)
+            getsLast = deal & lastDeal & (closing == p)
+            hands[rows[getsLast], p, empty[getsLast]] = lastCard[getsLast]
+            idx = rows[deal & ~(lastDeal & (closing == p))]
+            hands[idx, p, empty[idx]] = stock[idx, stockLen[idx] - 1]
+            stockLen[idx] -= 1
+
+    return score
+
+
+# TRICK_WINNER as an array indexed by [trump, winning card, card played]
+WINNERS = np.array(TRICK_WINNER, dtype=np.int8).reshape(4, 40, 40)
+BITS = np.left_shift(np.uint64(1), np.arange(40, dtype=np.uint64))
+
+
+class BatchEnv:
+    """ B games of Briscola with n players played in lockstep, for bulk self-play.
+        All the games are stored in NumPy arrays with one row per game: hands and discarded cards are 40-bit masks,
+        the cards on the table are stored by seat (-1 for no card). reset deals new games, legal_moves_mask gives
+        the cards every player to move can play and step plays one card in every game at once, resolving the
+        tricks and dealing from the stock with the same rules as BriscolaState. Finished games ignore their actions.
+    """
+
+    def __init__(self, batch, n=2):
+        self.batch = batch
+        self.numberOfPlayers = n
+        self.rows = np.arange(batch)
+        self.reset(range(batch))
+
+    def reset(self, seeds=None, decks=None):
+        """ Deal new games: from decks, a [B, 40] array of card ids dealt from the end like BriscolaState(n, deck),
+            or shuffled by np.random.default_rng(seed) for every seed of seeds.
+        """
+        B, n = self.batch, self.numberOfPlayers
+        if decks is None:
+            if seeds is None or len(seeds) != B:
+                raise Exception(f"reset needs {B} seeds or decks")
+            decks = np.stack([np.random.default_rng(seed).permutation(40) for seed in seeds])
+        decks = np.asarray(decks, dtype=np.int8)
+
+        self.hands = np.zeros((B, n + 1), dtype=np.uint64)
+        for p in range(1, n + 1):
+            for j in range(3):
+                self.hands[:, p] |= BITS[decks[:, 39 - 3 * (p - 1) - j]]
+        self.lastCard = decks[:, 39 - 3 * n].copy()
+        self.trump = SUITS[self.lastCard]
+        self.stock = decks.copy() # the next card dealt is stock[stockLen - 1], the last card after the stock
+        self.stockLen = np.full(B, 39 - 3 * n, dtype=np.int8)
+        self.trick = np.full((B, n), -1, dtype=np.int8) # card played by every seat in the current trick
+        self.discarded = np.zeros(B, dtype=np.uint64)
+        self.score = np.zeros((B, 2), dtype=np.int16)
+        self.player = np.ones(B, dtype=np.int8)
+        self.starting = np.ones(B, dtype=np.int8)
+        self.played = np.zeros(B, dtype=np.int8)
+        self.winner = np.zeros(B, dtype=np.int8)
+        self.winnerCard = np.zeros(B, dtype=np.int8)
+        self.points = np.zeros(B, dtype=np.int16)
+        self.moves = np.zeros(B, dtype=np.int8)
+        self.done = np.zeros(B, dtype=bool)
+
+    def legal_moves_mask(self):
+        """ Return a [B, 40] boolean array, True for the cards the player to move of every game can play.
+        """
+        hand = np.where(self.done, np.uint64(0), self.hands[self.rows, self.player])
+        return (hand[:, None] & BITS) != 0
+
+    def step(self, actions):
+        """ Play the card actions[i] for the player to move of every unfinished game i.
+            Return the [B, 2] points won by the teams [even, odd] with this move and the [B] finished games.
+        """
+        n, rows = self.numberOfPlayers, self.rows
+        c = np.asarray(actions, dtype=np.int8)
+        active = ~self.done
+        bit = BITS[np.where(active, c, 0)]
+        player = self.player
+        if (active & ((self.hands[rows, player] & bit) == 0)).any():
+            raise Exception("Some players do not hold the card they play")
+        idx = rows[active]
+        self.hands[idx, player[idx]] ^= bit[idx]
+        self.trick[idx, player[idx] - 1] = c[idx]
+        self.moves += active
+
+        # update the winner of the trick
+        take = active & ((self.played == 0) | (WINNERS[self.trump, self.winnerCard, np.where(active, c, 0)] == c))
+        self.winner = np.where(take, player, self.winner)
+        self.winnerCard = np.where(take, c, self.winnerCard)
+        self.points = np.where(active, self.points + POINTS[np.where(active, c, 0)], self.points)
+        self.played = np.where(active, self.played + 1, self.played)
+        self.player = np.where(active, (player % n) + 1, player).astype(np.int8)
+
+        #if the table is full, the round is over
+        gained = np.zeros((self.batch, 2), dtype=np.int16)
+        over = active & (self.played == n)
+        if over.any():
+            idx = rows[over]
+            gained[idx, self.winner[idx] % 2] = self.points[idx]
+            self.score += gained
+            for seat in range(n):
+                self.discarded[idx] |= BITS[self.trick[idx, seat]]
+            self.trick[idx] = -1
+            self.starting = np.where(over, self.winner, self.starting)
+            self.player = np.where(over, self.winner, self.player)
+            self.played[idx] = 0
+            self.points[idx] = 0
+            self.Deal(over & (self.stockLen > 0))
+
+        self.done = self.moves == 40
+        return gained, self.done
+
+    def Deal(self, deal):
+        """ Deal one card to every player of the games in deal, the closing player gets the last card on the last deal.
+        """
+        n, rows = self.numberOfPlayers, self.rows
+        closing = ((self.starting - 2) % n) + 1
+        lastDeal = self.stockLen + 1 == n
+        for p in range(1, n + 1):
+            getsLast = deal & lastDeal & (closing == p)
+            self.hands[getsLast, p] |= BITS[self.lastCard[getsLast]]
+            idx = rows[deal & ~(lastDeal & (closing == p))]
+            self.hands[idx, p] |= BITS[self.stock[idx, self.stockLen[idx] - 1]]
+            self.stockLen[idx] -= 1
+
+    def observe(self, player):
+        """ Return the [B, 40 * (n + 3) + n + 7] float32 observations of seat player in every game, made of:
+            its hand, the card played by every seat on the table (from player on, one block of 40 per seat),
+            the discarded cards and the last card (40 each, one-hot); the trump suit (4, one-hot);
+            the points of its team and of the other one and the cards left in the stock (divided by 120, 120 and 40);
+            the seat to move relative to player (n, one-hot).
+        """
+        n = self.numberOfPlayers
+        blocks = [(self.hands[:, player][:, None] & BITS) != 0]
+        for k in range(n):
+            seat = (player - 1 + k) % n
+            blocks.append((self.trick[:, seat][:, None] == np.arange(40)))
+        blocks.append((self.discarded[:, None] & BITS) != 0)
+        blocks.append(self.lastCard[:, None] == np.arange(40))
+        blocks.append(self.trump[:, None] == np.arange(4))
+        blocks.append(np.stack([self.score[:, player % 2] / 120, self.score[:, (player + 1) % 2] / 120,
+                                (self.stockLen + (self.stockLen > 0)) / 40], axis=1))
+        blocks.append(((self.player - player) % n)[:, None] == np.arange(n))
+        return np.concatenate([b.astype(np.float32) for b in blocks], axis=1)
+
+    def observations(self):
+        """ Return the [B, n, F] observations of all the seats, see observe.
+        """
+        return np.stack([self.observe(p) for p in range(1, self.numberOfPlayers + 1)], axis=1)
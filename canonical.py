@@ -0,0 +1,135 @@
+""" Suit symmetry of Briscola.
+    The rules only distinguish the trump suit from the others, so relabelling the suits in a way that keeps the
+    trump gives an equivalent position. A permutation perm maps suit s to perm[s]; the canonical labelling of a
+    position is the one, among the 6 permutations that map the trump to suit 0, giving the smallest encoding.
+    Positions that differ only by the labelling of the suits share their keys (StateKey, InfoSetKey), so caches
+    keyed by them hit for all the equivalent positions, and moves are mapped back with the inverse permutation.
+"""
+import itertools
+from briscola import CARDS, CARD_SUITS, SUIT_MASKS
+
+def GetPermutations(trump):
+    """ Return the suit permutations mapping trump to suit 0, as tuples perm with perm[suit] = new suit.
+    """
+    others = [s for s in range(4) if s != trump]
+    perms = []
+    for order in itertools.permutations([1, 2, 3]):
+        perm = [0] * 4
+        for s, t in zip(others, order):
+            perm[s] = t
+        perms.append(tuple(perm))
+    return perms
+
+PERMUTATIONS = [GetPermutations(trump) for trump in range(4)]
+
+def InversePermutation(perm):
+    inverse = [0] * 4
+    for s, t in enumerate(perm):
+        inverse[t] = s
+    return tuple(inverse)
+
+def PermuteCard(c, perm):
+    """ Return the id of card c with its suit relabelled by perm.
+    """
+    suit = CARD_SUITS[c]
+    return c - suit + perm[suit]
+
+def PermuteMask(mask, perm):
+    """ Return the mask of the cards of mask with their suits relabelled by perm.
+    """
+    result = 0
+    for s in range(4):
+        part = mask & SUIT_MASKS[s]
+        shift = perm[s] - s
+        result |= part << shift if shift >= 0 else part >> -shift
+    return result
+
+def CanonicalPermutation(masks, cards, trump):
+    """ Return the permutation mapping trump to suit 0 that gives the smallest (masks, cards) once applied,
+        where masks is a list of card masks and cards a list of card ids.
+    """
+    return min(PERMUTATIONS[trump],
+               key=lambda perm: ([PermuteMask(m, perm) for m in masks], [PermuteCard(c, perm) for c in cards]))
+
+def PermuteState(state, perm):
+    """ Return a copy of the BriscolaState state with the suits of all the cards relabelled by perm.
+    """
+    st = state.Clone()
+    st.handMasks = [PermuteMask(m, perm) for m in state.handMasks]
+    st.trick = [(p, PermuteCard(c, perm)) for p, c in state.trick]
+    st.discardedMask = PermuteMask(state.discardedMask, perm)
+    st.publicMask = PermuteMask(state.publicMask, perm)
+    st.stock = [PermuteCard(c, perm) for c in state.stock]
+    st.lastCardId = PermuteCard(state.lastCardId, perm)
+    st.trump = perm[state.trump]
+    st.history = [PermuteCard(c, perm) for c in state.history]
+    st.ComputeKeys()
+    return st
+
+def StatePermutation(state):
+    """ Return the canonical permutation of the whole state (hands, table, discards and stock).
+    """
+    cards = [c for _, c in state.trick] + state.stock + [state.lastCardId]
+    return CanonicalPermutation(state.handMasks[1:] + [state.discardedMask], cards, state.trump)
+
+def InfoSetPermutation(state, observer):
+    """ Return the canonical permutation of what observer knows of the state (own hand, table, discards and last card).
+    """
+    cards = [c for _, c in state.trick] + [state.lastCardId]
+    return CanonicalPermutation([state.handMasks[observer], state.discardedMask], cards, state.trump)
+
+def CanonicalState(state):
+    """ Return the canonical copy of state and the permutation that maps state to it.
+    """
+    perm = StatePermutation(state)
+    return PermuteState(state, perm), perm
+
+def CanonicalInfoSet(state, observer):
+    """ Return a copy of state in the canonical labelling of the information set of observer, and the permutation
+        that maps state to it. The hidden cards are relabelled too, but they are not taken into account.
+    """
+    perm = InfoSetPermutation(state, observer)
+    return PermuteState(state, perm), perm
+
+def CanonicalKey(state):
+    """ Return the Zobrist key (see BriscolaState.Key) of the canonical labelling of state.
+    """
+    return PermuteState(state, StatePermutation(state)).Key()
+
+def CanonicalInfoSetKey(state, observer):
+    """ Return the Zobrist key (see BriscolaState.InfoSetKey) of the canonical labelling of the information set of observer.
+    """
+    return PermuteState(state, InfoSetPermutation(state, observer)).InfoSetKey(observer)
+
+def StateKey(state):
+    """ Return a hashable key of state, the same for all the states equivalent up to the labelling of the suits.
+    """
+    st, _ = CanonicalState(state)
+    return (st.numberOfPlayers, st.playerToMove, st.playerStarting, tuple(st.handMasks), tuple(st.trick),
+            st.discardedMask, st.lastCardId, tuple(st.stock), tuple(st.score))
+
+def InfoSetKey(state, observer):
+    """ Return a hashable key of what observer knows of state, the same for all the equivalent labellings of the suits.
+        Only the current observation is encoded: which player played the discarded cards is not part of the key.
+    """
+    perm = InfoSetPermutation(state, observer)
+    return (state.numberOfPlayers, state.playerToMove, state.playerStarting, observer,
+            PermuteMask(state.handMasks[observer], perm), tuple((p, PermuteCard(c, perm)) for p, c in state.trick),
+            PermuteMask(state.discardedMask, perm), PermuteCard(state.lastCardId, perm), len(state.stock),
+            tuple(state.score))
+
+
+class CanonicalAgent:
+    """ Wrap an agent so that it is called on the canonical labelling of the information set of the player to move
+        (see CanonicalInfoSet) and its move is mapped back to the real suits. The caches of the wrapped agent are then
+        shared between equivalent positions; a tree kept between moves (ISMCTS.ISMCTSAgent) is rebuilt whenever
+        the canonical labelling changes during the game.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def __call__(self, state):
+        canonical, perm = CanonicalInfoSet(state, state.playerToMove)
+        move = self.agent(canonical)
+        return CARDS[PermuteCard(move.id, InversePermutation(perm))]
@@ -0,0 +1,229 @@
+""" Pool of determinizations of a Briscola information set, for ISMCTS (see ISMCTS.Search).
+    Instead of shuffling the unseen cards at every iteration (BriscolaState.Randomize), the pool deals size
+    determinizations at once with one vectorized shuffle and hands them out in turn. A determinization is a row
+    giving the owner of every card (-1 if the observer knows where it is, 0 for the stock, p for the hand of
+    player p) and a random key per card ordering the stock: the card with the largest key is drawn first.
+
+    The pool is kept across moves. When the information set of the observer grows, the cards played and drawn
+    since the last Sync are replayed in every row, the other players drawing the top of the stock of the row.
+    A row where a player plays a card it does not hold (or the observer draws a card the row gave to a player)
+    is not dropped but repaired: the card changes place with a random card of that player (of the stock), which
+    keeps the rows uniformly distributed over the deals consistent with what the observer has seen, so the same
+    rows serve the whole game. A new batch is dealt when all the rows have been handed out, or when less than a
+    quarter of them are left by the constraint.
+
+    Two hooks refine the uniform sampling. constraint(pool, state) returns a boolean array keeping only some of
+    the rows, e.g. to rule out hands a model of the opponents considers impossible; weight(pool, state) returns
+    their importance weights, e.g. CurrentTrickWeight, and the rows are handed out in a weighted resampling.
+"""
+import random
+import numpy as np
+from briscola import CARD_POINTS, HeuristicCard, MaskToIds, TRICK_WINNER, ZOBRIST_HAND
+from briscola_batch import BITS
+
+ZOBRIST = np.array(ZOBRIST_HAND, dtype=np.uint64)
+
+
+class CurrentTrickWeight:
+    """ Importance weight of the determinizations: the likelihood of the cards the other players have put on
+        the table in the current trick, if they play the greedy policy of briscola.HeuristicCard with probability
+        1 - epsilon and a random card otherwise. The hand they played from is known in every row.
+    """
+
+    def __init__(self, epsilon=0.5):
+        self.epsilon = epsilon
+
+    def __call__(self, pool, state):
+        weights = np.ones(len(pool.owner))
+        beats = TRICK_WINNER[state.trump]
+        winner, winnerCard, points = None, None, 0
+        for p, c in state.trick:
+            if p != pool.observer:
+                opponent = winner is not None and (winner - p) % 2 == 1
+                public = (state.handMasks[p] & state.publicMask) | 1 << c
+                for k, hand in enumerate(pool.HandMasks(p).tolist()):
+                    hand |= public
+                    greedy = HeuristicCard(hand, state.trump, opponent, winnerCard, points) == c
+                    weights[k] *= (1 - self.epsilon) * greedy + self.epsilon / hand.bit_count()
+            points += CARD_POINTS[c]
+            if winner is None or beats[winnerCard * 40 + c] == c:
+                winner, winnerCard = p, c
+        return weights
+
+
+class DeterminizationPool:
+    """ Determinizations of the information set of the player to move, see the module documentation.
+        Sync(state) brings the pool to the root state of a search and Randomize(state) then replaces the hidden
+        information of a copy of that state, like state.Randomize(state.playerToMove) but without shuffling.
+        rng is a numpy Generator. The counters dealt (batches dealt), reused (rows carried over to a new
+        information set) and exchanged (rows repaired) describe how much the pool is reused.
+    """
+
+    def __init__(self, size=256, constraint=None, weight=None, rng=None):
+        self.size = size
+        self.constraint = constraint
+        self.weight = weight
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        self.observer = None
+        self.history = None
+        self.dealt = 0
+        self.exchanged = 0
+        self.reused = 0
+
+    def Seed(self, seed):
+        """ Reseed the random generator and deal a new batch at the next Sync, e.g. in a copy of the pool sent
+            to another process.
+        """
+        self.rng = np.random.default_rng(seed)
+        self.history = None
+
+    def Sync(self, state):
+        """ Bring the pool to the information set of the player to move in state, updating the rows if state
+            follows the state of the last Sync in the same game, or dealing a new batch otherwise.
+        """
+        if (self.history is None or state.playerToMove != self.observer or state.lastCardId != self.lastCardId
+                or len(state.history) < len(self.history) or state.history[:len(self.history)] != self.history):
+            self.observer = state.playerToMove
+            self.lastCardId = state.lastCardId
+            self.Deal(state)
+        elif len(state.history) > len(self.history):
+            self.Update(state)
+
+    def Deal(self, state):
+        """ Deal a new batch of rows with one shuffle of the cards unseen by the observer. If no row satisfies the
+            constraint in 10 batches, the constraint is ignored.
+        """
+        unseen = np.array(MaskToIds(state.GetUnseenMask(self.observer)), dtype=np.int64)
+        owners = []
+        for p in range(1, state.numberOfPlayers + 1):
+            if p != self.observer:
+                owners += [p] * (state.handMasks[p] & ~state.publicMask).bit_count()
+        owners = np.array(owners + [0] * (len(unseen) - len(owners)), dtype=np.int8)
+
+        rows = np.arange(self.size)[:, None]
+        for _ in range(10):
+            shuffled = unseen[np.argsort(self.rng.random((self.size, len(unseen))), axis=1)]
+            self.owner = np.full((self.size, 40), -1, dtype=np.int8)
+            self.owner[rows, shuffled] = owners
+            self.key = self.rng.random((self.size, 40))
+            self.dealt += 1
+            if self.constraint is None or self.Filter(self.constraint(self, state)):
+                break
+        self.Prepare(state)
+
+    def Filter(self, keep):
+        """ Keep only the rows selected by the boolean array keep. Return False, keeping all of them, if none is.
+        """
+        if not keep.any():
+            return False
+        self.owner, self.key = self.owner[keep], self.key[keep]
+        return True
+
+    def Update(self, state):
+        """ Replay in every row the cards played and drawn since the last Sync, see the module documentation.
+        """
+        n = state.numberOfPlayers
+        observer = self.observer
+        beats = TRICK_WINNER[state.trump]
+        owner, key = self.owner, self.key
+        rows = np.arange(len(owner))
+
+        # the cards drawn by the observer leave the stock, where the rows that dealt them to a player put them
+        for c in MaskToIds(state.handMasks[observer] & ~self.hand):
+            self.Exchange(c, 0)
+            owner[:, c] = -1
+
+        trick, stockSize, player = list(self.trick), self.stockSize, observer
+        for c in state.history[len(self.history):]:
+            if player != observer:
+                self.Exchange(c, player)
+                owner[:, c] = -1
+            trick.append((player, c))
+            player = player % n + 1
+            if len(trick) < n:
+                continue
+            winner, winnerCard = trick[0]
+            for p, t in trick:
+                if beats[winnerCard * 40 + t] == t:
+                    winner, winnerCard = p, t
+            trick, player = [], winner
+            if stockSize:
+                # deal as BriscolaState.DealRound: the closing player takes the last card in the last round
+                closing = ((winner - 2) % n) + 1
+                lastDeal = stockSize + 1 == n
+                for p in range(1, n + 1):
+                    if lastDeal and p == closing:
+                        continue
+                    stockSize -= 1
+                    if p != observer:
+                        owner[rows, np.where(owner == 0, key, -1.0).argmax(axis=1)] = p
+
+        self.reused += len(owner)
+        if self.constraint is not None:
+            self.Filter(self.constraint(self, state))
+        if len(self.owner) < self.size // 4:
+            self.Deal(state)
+        else:
+            self.Prepare(state)
+
+    def Exchange(self, c, p):
+        """ Make every row give card c to p (a player, or 0 for the stock): where it does not, c changes place with
+            a card of p drawn uniformly. The rows stay uniformly distributed among the deals where p has c.
+        """
+        owner, key = self.owner, self.key
+        wrong = np.flatnonzero((owner[:, c] != p) & (owner[:, c] != -1))
+        if not len(wrong):
+            return
+        other = np.where(owner[wrong] == p, self.rng.random((len(wrong), 40)), -1.0).argmax(axis=1)
+        owner[wrong, other], owner[wrong, c] = owner[wrong, c], p
+        key[wrong, other], key[wrong, c] = key[wrong, c], key[wrong, other]
+        self.exchanged += len(wrong)
+
+    def HandMasks(self, p):
+        """ Return the masks of the hidden cards of player p in every row.
+        """
+        return np.bitwise_or.reduce(np.where(self.owner == p, BITS, np.uint64(0)), axis=1)
+
+    def Prepare(self, state):
+        """ Compute the hands, hand keys and stock of every row for Randomize, and the order they are handed out
+            in: a weighted resampling if there are weights, a random permutation otherwise.
+        """
+        self.history = list(state.history)
+        self.trick = list(state.trick)
+        self.stockSize = len(state.stock)
+        self.hand = state.handMasks[self.observer]
+        self.hands, self.keys = {}, {}
+        for p in range(1, state.numberOfPlayers + 1):
+            if p != self.observer:
+                public = state.handMasks[p] & state.publicMask
+                publicKey = 0
+                for c in MaskToIds(public):
+                    publicKey ^= ZOBRIST_HAND[p][c]
+                self.hands[p] = (self.HandMasks(p) | np.uint64(public)).tolist()
+                keys = np.bitwise_xor.reduce(np.where(self.owner == p, ZOBRIST[p], np.uint64(0)), axis=1)
+                self.keys[p] = (keys ^ np.uint64(publicKey)).tolist()
+        # the stock of a row lists its cards by increasing key, so the next card drawn is the last one
+        order = np.argsort(np.where(self.owner == 0, self.key, 2.0), axis=1)
+        self.stocks = order[:, :self.stockSize].tolist()
+
+        count = len(self.owner)
+        if self.weight is not None:
+            weights = self.weight(self, state)
+            total = weights.sum()
+            if total > 0:
+                self.order = self.rng.choice(count, count, p=weights / total).tolist()
+                return
+        self.order = self.rng.permutation(count).tolist()
+
+    def Randomize(self, state):
+        """ Replace the hidden information of state, a copy of the state of the last Sync, with the next row.
+            A new batch is dealt when all of them have been handed out.
+        """
+        if not self.order:
+            self.Deal(state)
+        k = self.order.pop()
+        for p, hands in self.hands.items():
+            state.handMasks[p] = hands[k]
+            state.handKeys[p] = self.keys[p][k]
+        state.stock = list(self.stocks[k])
+        state.stockKey = None
@@ -0,0 +1,155 @@
+""" Exact solver for the last tricks of a game of Briscola.
+    Once the stock is empty a determinized state has perfect information, so the remaining tricks can be
+    solved with alpha-beta minimax: the odd team maximizes the points it still wins, the even team minimizes them.
+    The values of the positions are kept in a transposition table keyed by a compact integer encoding
+    of the hands, the cards on the table and the player to move.
+"""
+from briscola import BriscolaResult, CARD_POINTS, MaskToIds, TRICK_WINNER
+from canonical import CanonicalPermutation, PermuteCard, PermuteMask
+
+# kinds of values stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class EndgameSolver:
+    """ Alpha-beta solver of Briscola positions with an empty stock, with a transposition table.
+        Calling the solver on a state returns the BriscolaResult of optimal play from the state, or None if the stock
+        is not empty yet, so it can be passed to ISMCTS as the evaluator of the leaves (see ISMCTS.Search).
+        The table is cleared when it holds more than maxEntries positions.
+        If tablebase is given (a tablebase.Tablebase), the 2 player positions it holds are looked up instead of searched.
+        If symmetry is True, every position is solved in its canonical suit labelling (see canonical), so the
+        table is shared between the positions that differ only by the labelling of the non-trump suits.
+    """
+
+    def __init__(self, maxEntries=1000000, tablebase=None, symmetry=True):
+        self.maxEntries = maxEntries
+        self.tablebase = tablebase
+        self.symmetry = symmetry
+        self.table = {}
+        self.hits = 0
+        self.nodes = 0
+
+    def Key(self, hands, trick, player, trump):
+        """ Return the integer key of a position: the hands, up to 3 cards on the table, the player to move and the trump.
+        """
+        key = 0
+        for hand in hands[1:]:
+            key = (key << 40) | hand
+        for i in range(3):
+            key = (key << 6) | (trick[i][1] + 1 if i < len(trick) else 0)
+        return (((key << 3) | player) << 2) | trump
+
+    def __call__(self, state):
+        if state.stock:
+            return None
+        return BriscolaResult(self.Solve(state), 40 - len(state.history))
+
+    def Solve(self, state):
+        """ Return the final scores [even, odd] of the game when both teams play perfectly from state,
+            whose stock must be empty.
+        """
+        if state.stock:
+            raise Exception("The endgame can be solved only when the stock is empty")
+        if len(self.table) > self.maxEntries:
+            self.table.clear()
+        hands, trick, trump = list(state.handMasks), list(state.trick), state.trump
+        if self.symmetry:
+            perm = CanonicalPermutation(hands[1:], [c for _, c in trick], trump)
+            hands = [PermuteMask(m, perm) for m in hands]
+            trick = [(p, PermuteCard(c, perm)) for p, c in trick]
+            trump = perm[trump]
+        odd = self.Value(hands, trick, state.playerToMove, trump, state.numberOfPlayers, -1, 121)
+        remaining = sum(CARD_POINTS[c] for c in MaskToIds(self.RemainingMask(state)))
+        return [state.score[0] + remaining - odd, state.score[1] + odd]
+
+    def RemainingMask(self, state):
+        """ Return the mask of the cards not yet won by any team: in the hands and on the table.
+        """
+        mask = 0
+        for hand in state.handMasks:
+            mask |= hand
+        for _, c in state.trick:
+            mask |= 1 << c
+        return mask
+
+    def GetBestMove(self, state):
+        """ Return the id of the best card for the player to move in state (the stock must be empty).
+        """
+        player = state.playerToMove
+        maximize = player % 2 == 1
+        best, bestValue = None, None
+        for c in MaskToIds(state.handMasks[player]):
+            st = state.Clone()
+            st.DoMove(st.GetMoveFromId(c))
+            value = self.Solve(st)[1] - state.score[1]
+            if bestValue is None or (value > bestValue if maximize else value < bestValue):
+                best, bestValue = c, value
+        return best
+
+    def Value(self, hands, trick, player, trump, n, alpha, beta):
+        """ Return the points the odd team wins from this position on (the cards on the table included),
+            exact if it is between alpha and beta, otherwise a bound on the same side of the window.
+            hands and trick are modified during the search and restored afterwards.
+        """
+        if not hands[player]:
+            return 0
+        self.nodes += 1
+
+        if self.tablebase is not None and n == 2:
+            led = trick[0][1] if trick else None
+            value = self.tablebase.Value(MaskToIds(hands[player]), MaskToIds(hands[3 - player]), led, trump)
+            if value is not None:
+                self.hits += 1
+                if player % 2 == 1:
+                    return value
+                remaining = sum(CARD_POINTS[c] for c in MaskToIds(hands[1] | hands[2])) + (CARD_POINTS[led] if trick else 0)
+                return remaining - value
+
+        key = self.Key(hands, trick, player, trump)
+        entry = self.table.get(key)
+        if entry is not None:
+            value, kind = entry
+            if kind == EXACT or (kind == LOWER and value >= beta) or (kind == UPPER and value <= alpha):
+                self.hits += 1
+                return value
+
+        maximize = player % 2 == 1
+        alpha0, beta0 = alpha, beta
+        best = -1 if maximize else 121
+        # try the cards worth more points first
+        for c in sorted(MaskToIds(hands[player]), key=lambda c: -CARD_POINTS[c]):
+            bit = 1 << c
+            hands[player] ^= bit
+            trick.append((player, c))
+            if len(trick) == n:
+                # resolve the trick, the winner leads the next one
+                winner, winnerCard = trick[0]
+                points = 0
+                beats = TRICK_WINNER[trump]
+                for p, t in trick:
+                    points += CARD_POINTS[t]
+                    if beats[winnerCard * 40 + t] == t:
+                        winner, winnerCard = p, t
+                gained = points if winner % 2 == 1 else 0
+                value = gained + self.Value(hands, [], winner, trump, n, alpha - gained, beta - gained)
+            else:
+                value = self.Value(hands, trick, (player % n) + 1, trump, n, alpha, beta)
+            trick.pop()
+            hands[player] ^= bit
+
+            if maximize:
+                best = max(best, value)
+                alpha = max(alpha, best)
+            else:
+                best = min(best, value)
+                beta = min(beta, best)
+            if alpha >= beta:
+                break
+
+        if best <= alpha0:
+            self.table[key] = (best, UPPER)
+        elif best >= beta0:
+            self.table[key] = (best, LOWER)
+        else:
+            self.table[key] = (best, EXACT)
+        return best
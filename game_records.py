@@ -0,0 +1,144 @@
+""" Compact binary records of Briscola games.
+    A record file starts with a header (magic, number of players and a name of up to 32 bytes for the agent of
+    every seat) followed by fixed-size game records: the game number, its seed, the final scores of the teams,
+    the winner, the number of cards played, the deck in the order given to BriscolaState(n, deck) (one byte per
+    card) and the cards played, one byte per card. With fixed-size records the file can be appended to by several
+    processes at once (every record is one write to a file opened in append mode) and any game can be read
+    directly from its position; RecordReader maps the file with mmap, so millions of games can be iterated or
+    indexed without loading them. A record cut short by a crash at the end of the file is ignored.
+"""
+from briscola import BriscolaState, CARDS
+import fcntl
+import mmap
+import os
+import struct
+
+MAGIC = b"BRGR"
+HEADER = struct.Struct("<4sBxxx32s32s32s32s") # magic, number of players, name of the agent of every seat
+RECORD = struct.Struct("<IQHHBB40s40s") # game, seed, scores [even, odd], winner, number of moves, deck, moves
+NO_MOVE = 255 # value of the move bytes after the end of the game
+
+
+def AgentName(agent):
+    """ Return a short name of agent for the header: the function of a functools.partial with its keyword
+        arguments, or the name of the class or function.
+    """
+    func = getattr(agent, "func", None)
+    if func is not None:
+        return " ".join([func.__name__] + [f"{k}={v}" for k, v in agent.keywords.items() if k != "verbose"])
+    return getattr(agent, "__name__", type(agent).__name__)
+
+
+class GameRecord:
+    """ A game read from a record file. deck and moves are lists of card ids.
+    """
+
+    def __init__(self, numberOfPlayers, game, seed, score, winner, deck, moves):
+        self.numberOfPlayers = numberOfPlayers
+        self.game = game
+        self.seed = seed
+        self.score = score
+        self.winner = winner
+        self.deck = deck
+        self.moves = moves
+
+    def State(self, ply=None):
+        """ Return the BriscolaState after the first ply cards of the game have been played (all of them by default).
+        """
+        state = BriscolaState(self.numberOfPlayers, self.deck)
+        for c in self.moves[:ply]:
+            state.DoMove(CARDS[c])
+        return state
+
+    def States(self):
+        """ Iterate over the states of the game, from the deal to the end, with the card played from every one of
+            them (None after the last card). The same state object is modified between two iterations.
+        """
+        state = BriscolaState(self.numberOfPlayers, self.deck)
+        for c in self.moves:
+            yield state, CARDS[c]
+            state.DoMove(CARDS[c])
+        yield state, None
+
+    def __repr__(self):
+        return f"Game {self.game} (seed {self.seed}): score {self.score}, {len(self.moves)} cards played"
+
+
+class RecordWriter:
+    """ Append game records to path, creating the file with its header if it does not exist (or is shorter than
+        the header). A record cut short by a crash at the end of an existing file is removed before appending.
+        Several processes can write to the same file at once, once it has been opened.
+    """
+
+    def __init__(self, path, numberOfPlayers, agentNames=()):
+        self.path = path
+        self.numberOfPlayers = numberOfPlayers
+        names = [name.encode()[:32] for name in agentNames] + [b""] * (4 - len(agentNames))
+        header = HEADER.pack(MAGIC, numberOfPlayers, *names)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX) # writers opening the file at once write the header once
+            size = os.fstat(fd).st_size
+            if size < HEADER.size:
+                # a new file, or one whose header was cut short
+                os.ftruncate(fd, 0)
+                os.write(fd, header)
+            else:
+                magic, n = HEADER.unpack(os.pread(fd, HEADER.size, 0))[:2]
+                if magic != MAGIC or n != numberOfPlayers:
+                    raise Exception(f"{path} is not a record file of games with {numberOfPlayers} players")
+                # cut a partial record, so the records appended stay aligned
+                os.ftruncate(fd, HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size)
+        finally:
+            os.close(fd)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def Write(self, game, seed, score, winner, deck, moves):
+        """ Append a game: its number, seed, final scores [even, odd], winner, deck and cards played (card ids).
+        """
+        os.write(self.fd, RECORD.pack(game, seed, score[0], score[1], winner, len(moves), bytes(deck),
+                                      bytes(moves) + bytes([NO_MOVE]) * (40 - len(moves))))
+
+    def Close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+
+class RecordReader:
+    """ A record file opened with mmap. reader[i] is the GameRecord of the i-th game of the file, in the order
+        they were written, and iterating over the reader gives all of them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.numberOfPlayers, *names = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a record file")
+        self.agentNames = [name.rstrip(b"\0").decode() for name in names[:self.numberOfPlayers]]
+        self.count = (len(self.data) - HEADER.size) // RECORD.size
+
+    def Close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        game, seed, even, odd, winner, length, deck, moves = RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+        return GameRecord(self.numberOfPlayers, game, seed, [even, odd], winner, list(deck), list(moves[:length]))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
@@ -2,6 +2,7 @@ import agents.ISMCTS as ISMCTS
 import briscola
 import random
 import argparse
+import multiprocessing
 
 def main():
     parser = argparse.ArgumentParser()
@@ -10,18 +11,24 @@ def main():
     parser.add_argument('--repeat', type=int, help='number of games to play', default=1)
     parser.add_argument('--timed', type=bool, help='whether to use itermax(0) or thinking time(1)', default=False)
     parser.add_argument('--points', type=bool, help='whether to consider points(1) or wins(0)', default=False)
+    parser.add_argument('--workers', type=int, help='number of processes for root-parallel search (default:1)', default=1)
     args = parser.parse_args()
     
     random.seed(args.seed)
+    # the same pool of processes is reused for every move
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
     agents = {
-        1: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=200, thinking_time=5, verbose=1, consider_points=args.points),
-        2: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points),
-        3: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points),
-        4: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points),
+        1: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=200, thinking_time=5, verbose=1, consider_points=args.points, workers=args.workers, pool=pool),
+        2: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points, workers=args.workers, pool=pool),
+        3: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points, workers=args.workers, pool=pool),
+        4: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=args.timed, itermax=100, thinking_time=5, verbose=1, consider_points=args.points, workers=args.workers, pool=pool),
     }
 
     for i in range(args.repeat):
         briscola.PlayGame(args.players, agents, verbose=True)
 
+    if pool is not None:
+        pool.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,279 @@
+""" Asyncio server answering move requests for many concurrent games.
+    Clients connect over TCP or a Unix socket and send one JSON object per line, with what the player to move
+    knows of its game (see InfoSet):
+        {"id": 7, "players": 2, "player": 1, "hand": [4, 17, 38], "last_card": 21, "history": [],
+         "deadline": 1.0, "time_left": 30.0}
+    "deadline" is the time in seconds the player can wait for the move and "time_left" what is left on the clock
+    of its game; both are optional. The server answers with one line per request, in the order the searches end:
+        {"id": 7, "move": 17, "iterations": 1520, "time": 0.93}
+    or {"id": 7, "error": "..."} if the request is not valid.
+
+    The searches run on a shared pool of worker processes. Requests wait in a priority queue, the games with
+    the least time_left first; every search is timed so that the answer arrives before its deadline, counting
+    the time spent in the queue, and stops early when its move is decided (see ISMCTS.Search). When max_pending
+    requests are waiting the server stops reading from the connections, so the clients are slowed down by the
+    socket buffers instead of the queue growing without bound.
+"""
+import agents.ISMCTS as ISMCTS
+from briscola import BriscolaState, CARD_POINTS, CARD_SUITS, FULL_MASK, MaskToIds, TRICK_WINNER
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import time
+
+
+def InfoSet(state, observer, **fields):
+    """ Return the request of a move of observer in the BriscolaState state, with the extra fields given.
+    """
+    return {"players": state.numberOfPlayers, "player": observer, "hand": MaskToIds(state.handMasks[observer]),
+            "last_card": state.lastCardId, "history": list(state.history), **fields}
+
+def StateFromInfoSet(n, observer, hand, lastCard, history):
+    """ Return a BriscolaState consistent with what observer knows: its hand, the last card of the deck and the
+        cards played since the beginning of the game (player 1 starts). The tricks, scores and the number of cards
+        of every player are replayed from history; the hidden cards are placed arbitrarily, since the search
+        randomizes them anyway. Raise an Exception if the information is inconsistent or observer is not to move.
+    """
+    if n not in (2, 4) or not 1 <= observer <= n:
+        raise Exception(f"Invalid player {observer} of {n}")
+    cards = list(hand) + list(history) + [lastCard]
+    if any(not 0 <= c < 40 for c in cards) or len(set(cards)) != len(cards) - (lastCard in hand or lastCard in history):
+        raise Exception("Invalid or repeated cards")
+
+    state = BriscolaState(n)
+    trump = CARD_SUITS[lastCard]
+    beats = TRICK_WINNER[trump]
+    counts = [0] + [3] * n # cards in the hand of every player
+    undealt = 40 - 3 * n # cards of the stock, the last card included
+    player, trick, discarded, score, lastHolder = 1, [], 0, [0, 0], None
+    for c in history:
+        trick.append((player, c))
+        counts[player] -= 1
+        player = (player % n) + 1
+        if len(trick) == n:
+            winner, winnerCard = trick[0]
+            for p, t in trick:
+                if beats[winnerCard * 40 + t] == t:
+                    winner, winnerCard = p, t
+            score[winner % 2] += sum(CARD_POINTS[t] for _, t in trick)
+            for _, t in trick:
+                discarded |= 1 << t
+            trick = []
+            player = winner
+            if undealt:
+                if undealt == n:
+                    lastHolder = ((winner - 2) % n) + 1
+                undealt -= n
+                for p in range(1, n + 1):
+                    counts[p] += 1
+
+    if player != observer:
+        raise Exception(f"Player {player} is to move, not {observer}")
+    if counts[observer] != len(hand):
+        raise Exception(f"Player {observer} should hold {counts[observer]} cards, not {len(hand)}")
+    lastBit = 1 << lastCard
+    lastKnown = lastHolder is not None and lastCard not in history
+    if lastKnown and (lastHolder == observer) != (lastCard in hand):
+        raise Exception(f"The last card was dealt to player {lastHolder}")
+    if not lastKnown and lastCard in hand:
+        raise Exception("The last card has not been dealt yet")
+
+    handMask = 0
+    for c in hand:
+        handMask |= 1 << c
+    playedMask = 0
+    for c in history:
+        playedMask |= 1 << c
+    state.handMasks = [0] * (n + 1)
+    state.handMasks[observer] = handMask
+    if lastKnown and lastHolder != observer:
+        state.handMasks[lastHolder] = lastBit
+    unseen = MaskToIds(FULL_MASK & ~(handMask | playedMask | lastBit))
+    i = 0
+    for p in range(1, n + 1):
+        if p != observer:
+            for _ in range(counts[p] - state.handMasks[p].bit_count()):
+                state.handMasks[p] |= 1 << unseen[i]
+                i += 1
+    state.stock = unseen[i:]
+    state.trick = trick
+    state.discardedMask = discarded
+    state.publicMask = discarded | lastBit
+    for _, c in trick:
+        state.publicMask |= 1 << c
+    state.lastCardId = lastCard
+    state.trump = trump
+    state.score = score
+    state.playerToMove = player
+    state.playerStarting = trick[0][0] if trick else player
+    state.history = list(history)
+    state.ComputeKeys()
+    return state
+
+def IsNumber(value):
+    """ Return True if value, from a JSON request, is a finite number.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def SearchMove(args):
+    """ Search the move of a request in a worker process and return the response without the id.
+    """
+    request, thinking_time, seed, search = args
+    random.seed(seed)
+    start_time = time.time()
+    state = StateFromInfoSet(request["players"], request["player"], request["hand"], request["last_card"],
+                             request["history"])
+    rootnode = ISMCTS.Search(state, timed=True, thinking_time=thinking_time, early_stop=True, **search)
+    move = max(rootnode.childNodes, key=lambda c: c.visits).move
+    return {"move": move.id, "iterations": rootnode.visits, "time": round(time.time() - start_time, 4)}
+
+
+class MoveServer:
+    """ The scheduler of the move requests, see the module documentation.
+        workers processes search at the same time; a request waits at most until its deadline (default_deadline
+        if the request has none) minus margin seconds for the communication, but is searched at least min_time
+        seconds. search holds extra keyword arguments of ISMCTS.Search, e.g. {"heuristic_rollouts": True}.
+        The counters served, errors and late (answered after their deadline) describe the activity of the server.
+    """
+
+    def __init__(self, workers=None, max_pending=None, default_deadline=1.0, margin=0.05, min_time=0.02,
+                 search=None, seed=None):
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending or 8 * self.workers
+        self.default_deadline = default_deadline
+        self.margin = margin
+        self.min_time = min_time
+        self.search = search or {}
+        self.rng = random.Random(seed)
+        self.order = itertools.count() # ties of priority are served first come, first served
+        self.queue = None
+        self.slots = None
+        self.executor = None
+        self.dispatchers = []
+        self.served = 0
+        self.errors = 0
+        self.late = 0
+
+    async def Start(self):
+        """ Start the pool of processes and the dispatchers. Called by Serve.
+        """
+        self.queue = asyncio.PriorityQueue()
+        self.slots = asyncio.Semaphore(self.max_pending)
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.dispatchers = [asyncio.create_task(self.Dispatch()) for _ in range(self.workers)]
+
+    async def Close(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.executor.shutdown(cancel_futures=True)
+
+    async def Enqueue(self, request):
+        """ Queue a request (a dict, see the module documentation), waiting while max_pending requests are
+            already queued, and return the future of its response.
+        """
+        future = asyncio.get_running_loop().create_future()
+        deadline = request.get("deadline", self.default_deadline)
+        priority = request.get("time_left", deadline)
+        entry = (priority, next(self.order), time.monotonic() + deadline, request, future)
+        await self.slots.acquire()
+        self.queue.put_nowait(entry)
+        return future
+
+    async def Submit(self, request):
+        """ Queue a request and return its response.
+        """
+        return await (await self.Enqueue(request))
+
+    async def Dispatch(self):
+        """ Run the queued searches one after the other, most urgent first. Start runs one dispatcher per worker
+            process, so the pool is kept busy while requests are queued.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            future = None
+            try:
+                _, _, deadline, request, future = await self.queue.get()
+                self.slots.release()
+                thinking_time = max(deadline - time.monotonic() - self.margin, self.min_time)
+                try:
+                    response = await loop.run_in_executor(
+                        self.executor, SearchMove, (request, thinking_time, self.rng.getrandbits(64), self.search))
+                    self.served += 1
+                except Exception as e:
+                    response = {"error": str(e)}
+                    self.errors += 1
+                if time.monotonic() > deadline:
+                    self.late += 1
+                if not future.done():
+                    future.set_result({"id": request.get("id"), **response})
+            except Exception as e:
+                # a bad item must not end the dispatcher, or the queue would no longer be served
+                self.errors += 1
+                if future is None:
+                    self.slots.release()
+                elif not future.done():
+                    future.set_result({"error": str(e)})
+
+    async def HandleConnection(self, reader, writer):
+        """ Answer the requests of a client, each line a request, as soon as their searches end.
+        """
+        pending = set()
+
+        async def Answer(future):
+            writer.write((json.dumps(await future) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    missing = [f for f in ("players", "player", "hand", "last_card", "history") if f not in request]
+                    if missing:
+                        raise Exception(f"Missing fields {', '.join(missing)}")
+                    for field in ("deadline", "time_left"):
+                        if field in request and not IsNumber(request[field]):
+                            raise Exception(f"{field} must be a number of seconds")
+                except Exception as e:
+                    self.errors += 1
+                    writer.write((json.dumps({"error": str(e)}) + "\n").encode())
+                    continue
+                # the next request is read only when there is room in the queue
+                task = asyncio.create_task(Answer(await self.Enqueue(request)))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+    async def Serve(self, host="127.0.0.1", port=8765, path=None):
+        """ Serve the requests on a TCP port, or on the Unix socket path if given, until cancelled.
+        """
+        await self.Start()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.HandleConnection, path)
+        else:
+            server = await asyncio.start_server(self.HandleConnection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.Close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, help='address to listen on (default:127.0.0.1)', default="127.0.0.1")
+    parser.add_argument('--port', type=int, help='TCP port (default:8765)', default=8765)
+    parser.add_argument('--unix', type=str, help='Unix socket path, instead of TCP (default:None)', default=None)
+    parser.add_argument('--workers', type=int, help='number of search processes (default:number of cores)', default=None)
+    parser.add_argument('--pending', type=int, help='maximum number of queued requests (default:8 per worker)', default=None)
+    parser.add_argument('--deadline', type=float, help='seconds per move when the request has no deadline (default:1.0)', default=1.0)
+    parser.add_argument('--heuristic', type=bool, help='whether to use heuristic rollouts(1) or random ones(0)', default=False)
+    args = parser.parse_args()
+    server = MoveServer(args.workers, args.pending, args.deadline, search={"heuristic_rollouts": args.heuristic})
+    asyncio.run(server.Serve(args.host, args.port, args.unix))
@@ -0,0 +1,197 @@
+""" Opening book for the first tricks of Briscola.
+    The first moves of a game are the most expensive to search, because almost every card is hidden.
+    The book stores the move chosen by a long ISMCTS search for the information sets of the first tricks,
+    keyed by the Zobrist key of their canonical suit labelling (see canonical.CanonicalInfoSetKey), so an
+    entry answers for all the equivalent labellings of the same hand, last card and table.
+
+    The file is a small header followed by the sorted keys (8 bytes each, in the byte order of the host) and the
+    canonical card ids of the moves (1 byte each), in the same order. It is read through mmap and searched by
+    bisection; the keys looked up recently are kept in memory in a LRU cache.
+"""
+import agents.ISMCTS as ISMCTS
+from briscola import BriscolaState, CARDS
+from canonical import InfoSetPermutation, InversePermutation, PermuteCard, PermuteState
+from collections import OrderedDict
+import argparse
+import array
+import bisect
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import time
+
+MAGIC = b"BROB"
+HEADER = struct.Struct("<4sBBxxQ") # magic, number of players, tricks, number of entries
+MISS = -1 # cached value of the keys not in the book
+
+
+class OpeningBook:
+    """ A book file opened with mmap, see the module documentation.
+        Lookup returns the book move for a state of the first tricks, or None; the last cacheSize keys looked up
+        are cached, misses included.
+    """
+
+    def __init__(self, path, cacheSize=4096):
+        self.path = path
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.numberOfPlayers, self.tricks, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not an opening book file")
+        if len(self.data) != HEADER.size + 9 * self.count:
+            raise Exception(f"{path} is truncated")
+        self.keys = memoryview(self.data)[HEADER.size:HEADER.size + 8 * self.count].cast("Q")
+        self.moves = HEADER.size + 8 * self.count
+
+    def __getstate__(self):
+        # reopen the file instead of copying the book when sent to another process
+        return self.path, self.cacheSize
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def Close(self):
+        self.keys.release()
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def Covers(self, state):
+        """ Return True if state is in the first tricks covered by the book.
+        """
+        return state.numberOfPlayers == self.numberOfPlayers and len(state.history) < self.tricks * self.numberOfPlayers
+
+    def Get(self, key):
+        """ Return the canonical card id stored for key, or None.
+        """
+        move = self.cache.get(key)
+        if move is not None:
+            self.cache.move_to_end(key)
+        else:
+            i = bisect.bisect_left(self.keys, key)
+            move = self.data[self.moves + i] if i < self.count and self.keys[i] == key else MISS
+            self.cache[key] = move
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+        return None if move == MISS else move
+
+    def Lookup(self, state):
+        """ Return the book move (a Card) of the player to move in state, or None if the information set is not in the book.
+        """
+        if not self.Covers(state):
+            return None
+        player = state.playerToMove
+        perm = InfoSetPermutation(state, player)
+        move = self.Get(PermuteState(state, perm).InfoSetKey(player))
+        if move is None:
+            return None
+        move = PermuteCard(move, InversePermutation(perm))
+        return CARDS[move] if state.handMasks[player] >> move & 1 else None
+
+
+class BookAgent:
+    """ Wrap an agent so that it plays the book move when the information set is in the opening book,
+        and searches with the wrapped agent otherwise. hits and misses count the lookups in the book.
+    """
+
+    def __init__(self, book, agent):
+        self.book = book
+        self.agent = agent
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state):
+        if self.book.Covers(state):
+            move = self.book.Lookup(state)
+            if move is not None:
+                self.hits += 1
+                return move
+            self.misses += 1
+        return self.agent(state)
+
+
+def Write(path, numberOfPlayers, tricks, entries):
+    """ Write the book of the entries {key: canonical card id} to path.
+    """
+    keys = sorted(entries)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, numberOfPlayers, tricks, len(keys)))
+        f.write(array.array("Q", keys).tobytes())
+        f.write(bytes(entries[k] for k in keys))
+
+def Read(path):
+    """ Return the number of players, the tricks and the entries {key: canonical card id} of the book at path.
+    """
+    book = OpeningBook(path)
+    entries = {k: book.data[book.moves + i] for i, k in enumerate(book.keys)}
+    numberOfPlayers, tricks = book.numberOfPlayers, book.tricks
+    book.Close()
+    return numberOfPlayers, tricks, entries
+
+def BuildWorker(args):
+    """ Deal a game from seed and search every move of its first tricks in the canonical labelling of the
+        information set of the player to move. Return the list of (key, canonical card id).
+    """
+    n, tricks, itermax, seed = args
+    rng = random.Random(seed)
+    deck = list(range(40))
+    rng.shuffle(deck)
+    random.seed(rng.getrandbits(64))
+    state = BriscolaState(n, deck)
+
+    entries = []
+    while len(state.history) < tricks * n:
+        player = state.playerToMove
+        perm = InfoSetPermutation(state, player)
+        canonical = PermuteState(state, perm)
+        move = ISMCTS.ISMCTS(canonical, itermax, verbose=0).id
+        entries.append((canonical.InfoSetKey(player), move))
+        state.DoMove(CARDS[PermuteCard(move, InversePermutation(perm))])
+    return entries
+
+def Build(path, n=2, tricks=1, deals=1000, itermax=10000, workers=1, seed=0, verbose=True):
+    """ Search the first tricks of deals seeded games with itermax iterations per move and write the book to path.
+        If path is already a book for the same game, its entries are kept and the new deals are added to it
+        (use a different seed to cover new deals), so a book can be built over several runs.
+    """
+    entries = {}
+    if os.path.exists(path):
+        numberOfPlayers, oldTricks, entries = Read(path)
+        if (numberOfPlayers, oldTricks) != (n, tricks):
+            raise Exception(f"{path} is a book of {oldTricks} tricks for {numberOfPlayers} players")
+
+    start_time = time.time()
+    tasks = [(n, tricks, itermax, random.Random(f"{seed}:{i}").getrandbits(64)) for i in range(deals)]
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap_unordered(BuildWorker, tasks) if pool is not None else map(BuildWorker, tasks)
+        for i, result in enumerate(results):
+            entries.update(result)
+            if verbose and (i + 1) % 100 == 0:
+                print(f"{i + 1}/{deals} deals, {len(entries)} entries, {time.time() - start_time:.1f}s")
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    Write(path, n, tricks, entries)
+    if verbose:
+        print(f"{len(entries)} entries written to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, help='number of players (default:2)', default=2, choices=[2, 4])
+    parser.add_argument('--tricks', type=int, help='number of tricks covered by the book (default:1)', default=1, choices=[1, 2])
+    parser.add_argument('--deals', type=int, help='number of deals searched (default:1000)', default=1000)
+    parser.add_argument('--iterations', type=int, help='ISMCTS iterations per move (default:10000)', default=10000)
+    parser.add_argument('--workers', type=int, help='number of processes searching (default:1)', default=1)
+    parser.add_argument('--seed', type=int, help='random seed (default:0)', default=0)
+    parser.add_argument('--output', type=str, help='book file (default:opening2p.book)', default=None)
+    args = parser.parse_args()
+    Build(args.output or f"opening{args.players}p.book", args.players, args.tricks, args.deals, args.iterations,
+          args.workers, args.seed)
@@ -1,17 +1,35 @@
 import agents.ISMCTS as ISMCTS
 from briscola import BriscolaState
+from game_records import AgentName, RecordReader, RecordWriter
+from functools import partial
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
 import time
 
-def PlayGame(n, agents, winners, scores, verbose=False):
+def PlayGame(n, agents, winners, scores, verbose=False, times=None, deck=None, moveStats=None):
     """ Play a sample game between two ISMCTS players.
+        If times is a dict, the thinking time of every player is added to it.
+        deck is the order of the cards to deal (see BriscolaState.InitDeal), by default a random one.
+        If moveStats is a list, the search statistics of every move of the agents that provide them
+        (in their stats attribute, like ISMCTS.ISMCTSAgent with collect_stats) are appended to it.
+        Return the final state.
     """
-    state = BriscolaState(n)
+    state = BriscolaState(n, deck)
 
     while state.GetMoves() != []:
         if verbose:
             print(str(state))
         # Use different numbers of iterations (simulations, tree nodes) for different players
+        start_time = time.time()
         m = agents[state.playerToMove](state)
+        if times is not None:
+            times[state.playerToMove] += time.time() - start_time
+        if moveStats is not None and getattr(agents[state.playerToMove], "stats", None):
+            moveStats.append({"player": state.playerToMove, "move": str(m), **agents[state.playerToMove].stats})
         if verbose:
             print("Best Move: " + str(m) + "\n")
         state.DoMove(m)
@@ -22,22 +40,168 @@ def PlayGame(n, agents, winners, scores, verbose=False):
         scores[p] += state.GetResult(p, get_points=True)
     if verbose:
         print(f"Final score: {state.score}")
+    return state
 
 
-def run_experiment(agents, n_games=100, verbose=False):
+def GameSeed(seed, game):
+    """ Return the seed of game number game of an experiment with master seed seed.
+    """
+    return random.Random(seed * 1000003 + game).getrandbits(64)
+
+def PlayGameWorker(args):
+    """ Play game number game with its own seed and return its record: the seed, the points of the team of every
+        player, the winner (the first player of the winning team, 0 for a draw), the timings and, if collectStats
+        is True, the search statistics of every move in "move_stats" (see PlayGame).
+        If recordMoves is True, the record also holds the "deck" dealt and the cards played ("moves").
+    """
+    game, masterSeed, agents, collectStats, recordMoves = args
+    n = len(agents)
+    seed = GameSeed(masterSeed, game)
+    random.seed(seed)
+    winners = {p: 0 for p in range(1, n + 1)}
+    scores = {p: 0 for p in range(1, n + 1)}
+    times = {p: 0.0 for p in range(1, n + 1)}
+    moveStats = [] if collectStats else None
+
+    # the same shuffle as BriscolaState.InitDeal, so recording the deck does not change the game
+    deck = list(range(40))
+    random.shuffle(deck)
+
+    start_time = time.time()
+    state = PlayGame(n, agents, winners, scores, times=times, deck=deck, moveStats=moveStats)
+
+    record = {"game": game, "master_seed": masterSeed, "seed": seed,
+              "winner": next((p for p in range(1, n + 1) if winners[p]), 0)}
+    for p in range(1, n + 1):
+        record[f"points_{p}"] = state.score[p % 2]
+    record["time"] = time.time() - start_time
+    for p in range(1, n + 1):
+        record[f"time_{p}"] = times[p]
+    if collectStats:
+        record["move_stats"] = moveStats
+    if recordMoves:
+        record["deck"] = deck
+        record["moves"] = list(state.history)
+    return record
+
+def LoadRecords(output):
+    """ Return the game records already written to output (a .csv file, otherwise JSON lines).
+        A record cut short by a crash is removed from the file.
+    """
+    if not os.path.exists(output):
+        return []
+    with open(output, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    lines = data[:end].decode().splitlines()
+
+    if output.endswith(".csv"):
+        records = list(csv.DictReader(lines))
+        for record in records:
+            for key, value in record.items():
+                if key == "move_stats":
+                    record[key] = json.loads(value)
+                else:
+                    record[key] = float(value) if key.startswith("time") else int(value)
+        return records
+    return [json.loads(line) for line in lines if line]
+
+def WriteRecord(f, record, isCsv):
+    """ Append record to the open file f and flush it to disk.
+    """
+    if isCsv:
+        if "move_stats" in record:
+            record = {**record, "move_stats": json.dumps(record["move_stats"])}
+        writer = csv.DictWriter(f, fieldnames=list(record))
+        if f.tell() == 0:
+            writer.writeheader()
+        writer.writerow(record)
+    else:
+        f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def run_experiment(agents, n_games=100, verbose=False, workers=1, seed=None, output=None, collect_stats=False,
+                   game_records=None):
+    """ Play n_games games between agents, a dict {player: agent}, and return the dicts
+        winners (games won by every player) and scores (sum of the point differences of every player).
+        Every game is seeded with GameSeed(seed, game), so an experiment with the same seed plays the same games.
+        With workers > 1 the games are spread over a pool of processes, so the agents must be picklable
+        (e.g. functools.partial of ISMCTS.ISMCTS or an ISMCTS.ISMCTSAgent, not a lambda).
+        If output is given, the record of every game (see PlayGameWorker) is appended to it as soon as the game
+        ends, as JSON lines or as CSV if the name ends with .csv. If output already holds some records, for
+        example after a crash, those games are not played again and the experiment resumes with the same seed.
+        If collect_stats is True, the records also hold the search statistics of every move (see PlayGameWorker).
+        If game_records is given, the deck and the cards played of every game are appended to that binary record file
+        (see game_records), from which any position can be replayed. Its games are resumed too: a game it already
+        holds is not written again, and is not played again unless output is given and misses it.
+    """
     NPLAYERS = len(agents)
 
     winners = {p: 0 for p in range(1, NPLAYERS + 1)}
     scores = {p: 0 for p in range(1, NPLAYERS + 1)}
 
-    print(f"Starting {n_games} games...")
+    records = LoadRecords(output) if output is not None else []
+    recorded = {}
+    if game_records is not None and os.path.exists(game_records):
+        reader = RecordReader(game_records)
+        recorded = {game.game: game for game in reader}
+        reader.Close()
+    if seed is None:
+        seed = records[0]["master_seed"] if records else random.getrandbits(32)
+    if any(record["master_seed"] != seed for record in records):
+        raise Exception(f"{output} holds games of an experiment with a different seed")
+    if any(game.seed != GameSeed(seed, game.game) for game in recorded.values()):
+        raise Exception(f"{game_records} holds games of an experiment with a different seed")
+    if output is None:
+        # the record file is the only trace of the games played
+        records = [{"game": game.game, **{f"points_{p}": game.score[p % 2] for p in range(1, NPLAYERS + 1)}}
+                   for game in recorded.values()]
+    done = {record["game"] for record in records if record["game"] < n_games}
+
+    def Count(record):
+        for p in range(1, NPLAYERS + 1):
+            mine, theirs = record[f"points_{p}"], record[f"points_{p % NPLAYERS + 1}"]
+            if mine > theirs:
+                winners[p] += 1
+            scores[p] += mine - theirs
 
+    for record in records:
+        if record["game"] < n_games:
+            Count(record)
+    if done:
+        print(f"Resuming: {len(done)}/{n_games} games already played")
+    print(f"Starting {n_games - len(done)} games...")
+
+    tasks = [(i, seed, agents, collect_stats, game_records is not None) for i in range(n_games) if i not in done]
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    f = open(output, "a", newline="") if output is not None else None
+    writer = None
+    if game_records is not None:
+        writer = RecordWriter(game_records, NPLAYERS, [AgentName(agents[p]) for p in range(1, NPLAYERS + 1)])
     start_time = time.time()
-    for i in range(n_games):
-        if(i % 20 == 0):
-            print(f"  {i}/{n_games} games completed")
-        PlayGame(4, agents, winners, scores)
-        
+    try:
+        results = pool.imap_unordered(PlayGameWorker, tasks) if pool is not None else map(PlayGameWorker, tasks)
+        for i, record in enumerate(results, len(done)):
+            if(i % 20 == 0):
+                print(f"  {i}/{n_games} games completed")
+            Count(record)
+            deck, moves = record.pop("deck", None), record.pop("moves", None)
+            if writer is not None and record["game"] not in recorded:
+                writer.Write(record["game"], record["seed"], [record["points_2"], record["points_1"]],
+                             record["winner"], deck, moves)
+            if f is not None:
+                WriteRecord(f, record, output.endswith(".csv"))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if f is not None:
+            f.close()
+        if writer is not None:
+            writer.Close()
 
     print(f"Time taken: {time.time() - start_time}")
 
@@ -50,10 +214,19 @@ def run_experiment(agents, n_games=100, verbose=False):
     return winners, scores
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, help='number of games (default:200)', default=200)
+    parser.add_argument('--workers', type=int, help='number of processes playing games (default:1)', default=1)
+    parser.add_argument('--seed', type=int, help='master seed (default:None)', default=None)
+    parser.add_argument('--output', type=str, help='JSON lines or .csv file of the game records, resumed if it exists (default:None)', default=None)
+    parser.add_argument('--records', type=str, help='binary file of the decks and moves of the games (default:None)', default=None)
+    args = parser.parse_args()
+
     agents = {
-        1: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=True),
-        2: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=False),
-        3: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=True),
-        4: lambda s: ISMCTS.ISMCTS(rootstate=s, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=False),
+        1: partial(ISMCTS.ISMCTS, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=True),
+        2: partial(ISMCTS.ISMCTS, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=False),
+        3: partial(ISMCTS.ISMCTS, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=True),
+        4: partial(ISMCTS.ISMCTS, timed=False, itermax=100, thinking_time=5, verbose=0, consider_points=False),
     }
-    run_experiment(agents, n_games=200, verbose=True)
\ No newline at end of file
+    run_experiment(agents, n_games=args.games, verbose=True, workers=args.workers, seed=args.seed, output=args.output,
+                   game_records=args.records)
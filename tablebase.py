@@ -0,0 +1,195 @@
+""" On-disk endgame tablebase for 2 player Briscola.
+    Once the stock is empty the value of a 2 player position depends only on the cards left in the two hands,
+    the card on the table (if the player to move is answering a lead) and the trump. The tablebase stores,
+    for every such position with at most maxCards cards per hand, the points the player to move wins from
+    there on (the card on the table included), one byte per position.
+
+    Positions are encoded canonically: the suits are relabelled so that the trump is suit 0, then the position
+    is numbered in its section (see GetSections) by the colex rank of the hand of the player to move among the 40
+    cards, the rank of the other hand among the remaining cards and the index of the card on the table.
+    The file is a small header followed by the sections, and it is read through mmap, so a lookup is a few
+    arithmetic operations and one byte read, and the processes of one host share the page cache.
+
+    Generating the full table (maxCards=3) means solving about 300 million positions, which is not practical
+    in pure Python: by default only the last two tricks (maxCards=2, about 1.7 million positions) are generated.
+"""
+from briscola import BriscolaResult, CARD_POINTS, CARD_RANKS, CARD_SUITS, MaskToIds
+from math import comb
+import argparse
+import itertools
+import mmap
+import struct
+import time
+
+MAGIC = b"BRTB"
+HEADER = struct.Struct("<4sBxxx") # magic, maxCards
+UNKNOWN = 255 # value of the slots of impossible positions
+
+def GetSections(maxCards):
+    """ Return the sections of a table of positions with up to maxCards cards in hand, in the order they are
+        stored and solved, as a list of (cards of the player to move, cards of the other player, card on the table).
+    """
+    sections = []
+    for k in range(1, maxCards + 1):
+        sections.append((k, k - 1, True))
+        sections.append((k, k, False))
+    return sections
+
+def SectionSize(k, other, led):
+    return comb(40, k) * comb(40 - k, other) * (40 - k - other if led else 1)
+
+def GetOffsets(maxCards, start=0):
+    """ Return {section: position of its first value} for the sections stored from start, and the end position.
+    """
+    offsets = {}
+    for section in GetSections(maxCards):
+        offsets[section] = start
+        start += SectionSize(*section)
+    return offsets, start
+
+def CanonicalCard(c, trump):
+    """ Return the id of card c after swapping the trump suit with suit 0.
+    """
+    suit = CARD_SUITS[c]
+    if suit == trump:
+        return c - suit
+    if suit == 0:
+        return c + trump
+    return c
+
+def Rank(ids, excluded=()):
+    """ Return the colex rank of the set of card ids (sorted) among the sets of the same size of cards
+        not in excluded (sorted), i.e. sum of comb(position, i + 1).
+    """
+    rank = 0
+    j = 0
+    for i, c in enumerate(ids):
+        while j < len(excluded) and excluded[j] < c:
+            j += 1
+        rank += comb(c - j, i + 1)
+    return rank
+
+def Index(offsets, mover, other, led, trump):
+    """ Return the position of the value of the position where the player to move holds the cards mover,
+        the other player holds other and led is the card on the table (or None), all card ids.
+        offsets are the positions of the sections, see GetOffsets.
+    """
+    mover = sorted(CanonicalCard(c, trump) for c in mover)
+    other = sorted(CanonicalCard(c, trump) for c in other)
+    index = Rank(mover) * comb(40 - len(mover), len(other)) + Rank(other, mover)
+    if led is not None:
+        led = CanonicalCard(led, trump)
+        index = index * (40 - len(mover) - len(other)) + Rank([led], sorted(mover + other))
+    return offsets[(len(mover), len(other), led is not None)] + index
+
+def Beats(c, w):
+    """ Return True if card c, played after w, wins the trick against it (the trump is suit 0).
+    """
+    return (CARD_SUITS[c] == 0 and CARD_SUITS[w] != 0) or (CARD_SUITS[c] == CARD_SUITS[w] and CARD_RANKS[c] > CARD_RANKS[w])
+
+
+class Tablebase:
+    """ A tablebase file opened with mmap, see the module documentation.
+        Calling it on a state returns the BriscolaResult of optimal play from the state, or None if the position
+        is not in the table, so it can be used as the evaluator of ISMCTS.Search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.maxCards = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a tablebase file")
+        self.offsets, end = GetOffsets(self.maxCards, HEADER.size)
+        if len(self.data) != end:
+            raise Exception(f"{path} is truncated")
+
+    def __getstate__(self):
+        # reopen the file instead of copying the table when sent to another process
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def Close(self):
+        self.data.close()
+        self.file.close()
+
+    def Value(self, mover, other, led, trump):
+        """ Return the points won by the player to move from the position (see Index), or None if it is not in the table.
+        """
+        if not mover or (len(mover), len(other), led is not None) not in self.offsets:
+            return None
+        value = self.data[Index(self.offsets, mover, other, led, trump)]
+        return None if value == UNKNOWN else value
+
+    def Lookup(self, state):
+        """ Return the points won by the player to move of a 2 player BriscolaState from now on (the cards on the
+            table included) with perfect play, or None if the position is not in the table.
+        """
+        if state.numberOfPlayers != 2 or state.stock or not state.handMasks[state.playerToMove]:
+            return None
+        player = state.playerToMove
+        led = state.trick[0][1] if state.trick else None
+        return self.Value(MaskToIds(state.handMasks[player]), MaskToIds(state.handMasks[3 - player]), led, state.trump)
+
+    def __call__(self, state):
+        value = self.Lookup(state)
+        if value is None:
+            return None
+        player = state.playerToMove
+        remaining = sum(CARD_POINTS[c] for c in MaskToIds(state.handMasks[1] | state.handMasks[2]))
+        remaining += sum(CARD_POINTS[c] for _, c in state.trick)
+        score = list(state.score)
+        score[player % 2] += value
+        score[(player + 1) % 2] += remaining - value
+        return BriscolaResult(score, 40 - len(state.history))
+
+
+def Generate(path, maxCards=2, verbose=True):
+    """ Solve every position with up to maxCards cards per hand and write the tablebase to path.
+        The sections are solved from the smallest, each position from the positions after the next card.
+    """
+    offsets, end = GetOffsets(maxCards)
+    table = bytearray([UNKNOWN]) * end
+    index = lambda mover, other, led: Index(offsets, mover, other, led, 0)
+
+    for section in GetSections(maxCards):
+        k, o, led = section
+        start_time = time.time()
+        for mover in itertools.combinations(range(40), k):
+            rest = [c for c in range(40) if c not in mover]
+            for other in itertools.combinations(rest, o):
+                free = [c for c in rest if c not in other] if led else [None]
+                total = sum(CARD_POINTS[c] for c in mover) + sum(CARD_POINTS[c] for c in other)
+                for l in free:
+                    best = -1
+                    for c in mover:
+                        hand = [x for x in mover if x != c]
+                        if l is None:
+                            # the other player answers c and wins what the player to move does not
+                            value = total - table[index(other, hand, c)]
+                        else:
+                            points = CARD_POINTS[l] + CARD_POINTS[c]
+                            if not hand:
+                                value = points if Beats(c, l) else 0
+                            elif Beats(c, l):
+                                value = points + table[index(hand, other, None)]
+                            else:
+                                value = total - CARD_POINTS[c] - table[index(other, hand, None)]
+                        best = max(best, value)
+                    table[index(mover, other, l)] = best
+        if verbose:
+            print(f"section {section}: {SectionSize(*section)} positions in {time.time() - start_time:.1f}s")
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, maxCards))
+        f.write(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, help='maximum number of cards per hand (default:2)', default=2, choices=[1, 2, 3])
+    parser.add_argument('--output', type=str, help='tablebase file (default:endgame2p.tb)', default="endgame2p.tb")
+    args = parser.parse_args()
+    Generate(args.output, args.cards)
@@ -1,10 +1,14 @@
 import sys
 import os
+import random
+import time
 
 # Add the directory containing briscola.py to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import briscola
+import agents.ISMCTS as ISMCTS
+from agents.time_manager import TimeManager
 
 def testCards():
     card = briscola.Card(2, "B")
@@ -56,9 +60,308 @@ def testClosingPlayer():
     assert state.GetClosingPlayer() == 2
     
 
+def testCardIds():
+    deck = briscola.Card.GetNewDeck()
+    assert len(deck) == 40
+    for i, card in enumerate(deck):
+        assert card.id == i
+        assert briscola.Card.FromId(i) == card
+        assert briscola.CARD_POINTS[i] == card.GetPoints()
+        assert briscola.Card(card.rank, card.suit).id == i
+
+    hand = [briscola.Card(12, "C"), briscola.Card(2, "O"), briscola.Card(9, "B")]
+    mask = briscola.CardsToMask(hand)
+    assert bin(mask).count("1") == 3
+    assert sorted(briscola.MaskToCards(mask), key=lambda c: c.id) == sorted(hand, key=lambda c: c.id)
+    assert sum(bin(m).count("1") for m in briscola.SUIT_MASKS) == 40
+
+def testRandomGame():
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        assert all(len(h) == 3 for h in state.playerHands.values())
+        while state.GetMoves() != []:
+            state.DoMove(random.choice(state.GetMoves()))
+            # every card is in a hand, in the stock or has been seen by everybody
+            cards = state.publicMask | briscola.CardsToMask(briscola.Card.FromId(c) for c in state.stock)
+            for p in range(1, n + 1):
+                cards |= state.handMasks[p]
+            assert cards == briscola.FULL_MASK
+
+            if state.stock == [] and state.GetMoves() != []:
+                # the player who drew the last card keeps it in every determinization
+                holder = [p for p in range(1, n + 1) if state.handMasks[p] & (1 << state.lastCardId)]
+                det = state.CloneAndRandomize(state.playerToMove)
+                assert holder == [p for p in range(1, n + 1) if det.handMasks[p] & (1 << state.lastCardId)]
+        assert sum(state.score) == 120
+        assert len(state.discarded) == 40
+
+def testUndoMove():
+    def snapshot(state):
+        return (state.playerToMove, state.playerStarting, list(state.handMasks), list(state.trick),
+                state.discardedMask, state.publicMask, list(state.stock), list(state.score))
+
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        history = []
+        while state.GetMoves() != []:
+            before = snapshot(state)
+            undo = state.DoMove(random.choice(state.GetMoves()))
+            history.append((before, undo))
+        while history:
+            before, undo = history.pop()
+            state.UndoMove(undo)
+            assert snapshot(state) == before
+
+    # cloning does not deal again and randomizing keeps the observer's information
+    state = briscola.BriscolaState(4)
+    state.DoMove(state.GetMoves()[0])
+    clone = state.Clone()
+    assert snapshot(clone) == snapshot(state)
+    clone.Randomize(1)
+    assert clone.handMasks[1] == state.handMasks[1]
+    assert clone.GetSeenMask(1) == state.GetSeenMask(1)
+    assert len(clone.stock) == len(state.stock)
+    assert clone.GetUnseenMask(1) == state.GetUnseenMask(1)
+    assert [bin(m).count("1") for m in clone.handMasks] == [bin(m).count("1") for m in state.handMasks]
+
+def testRandomRollout():
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        for _ in range(7):
+            state.DoMove(random.choice(state.GetMoves()))
+        before = repr(state) + str(state.stock)
+        result = state.DoRandomRollout(random.Random(0))
+        assert repr(state) + str(state.stock) == before
+        assert sum(result.score) == 120
+        assert result.GetResult(1) == -result.GetResult(2)
+        assert result.GetResult(1, get_points=False) == (result.score[1] > result.score[0])
+
+def testArrayTree():
+    random.seed(0)
+    state = briscola.BriscolaState(2)
+    rootnode = ISMCTS.Search(state, itermax=300)
+    assert rootnode.tree.count > 1
+    assert sum(c.visits for c in rootnode.childNodes) == 300
+    assert sorted(c.move.id for c in rootnode.childNodes) == sorted(c.id for c in state.GetMoves())
+    assert rootnode.ChildrenToString().count("\n") == 3
+    assert rootnode.TreeToString(0).count("\n") == rootnode.tree.count
+    for child in rootnode.childNodes:
+        assert child.parentNode == rootnode
+        assert child.playerJustMoved == 1
+
+def testSubtreeReuse():
+    random.seed(0)
+    state = briscola.BriscolaState(2)
+    agent = ISMCTS.ISMCTSAgent(itermax=500)
+    move = agent(state)
+    state.DoMove(move)
+    node = next(c for c in agent.rootnode.childNodes if c.move == move)
+    reply = max((c for c in node.childNodes if c.move in state.GetMoves()), key=lambda c: c.visits)
+    expected = (reply.visits, reply.wins, len(reply.childNodes))
+    state.DoMove(reply.move)
+
+    agent.Advance(state)
+    assert (agent.rootnode.visits, agent.rootnode.wins, len(agent.rootnode.childNodes)) == expected
+    assert agent.rootnode.tree.count < node.tree.count
+    agent(state)
+    assert agent.rootnode.visits == expected[0] + 500
+
+    # a new game discards the tree
+    agent.Advance(briscola.BriscolaState(2))
+    assert agent.rootnode is None
+
+def testSubtreeReuseSeats():
+    # an agent playing both seats of a team keeps the tree of each seat to itself
+    random.seed(0)
+    state = briscola.BriscolaState(4)
+    agent = ISMCTS.ISMCTSAgent(itermax=300)
+    roots = {}
+    while state.GetMoves() != []:
+        p = state.playerToMove
+        if p % 2 == 1:
+            agent.Advance(state)
+            if p not in roots:
+                assert agent.rootnode is None
+            elif agent.rootnode is not None:
+                assert agent.rootnode.visits <= roots[p]
+            move = agent(state)
+            roots[p] = agent.rootnode.visits
+            state.DoMove(move)
+        else:
+            state.DoMove(random.choice(state.GetMoves()))
+    assert set(roots) == {1, 3} and set(agent.trees) == {1}
+
+def testMemoryBound():
+    random.seed(0)
+    state = briscola.BriscolaState(4)
+    for prune in (False, True):
+        stats = {}
+        rootnode = ISMCTS.Search(state, 2000, max_nodes=300, prune=prune, stats=stats)
+        assert stats["peak_nodes"] <= 300 and rootnode.tree.count <= 300
+        assert len(rootnode.childNodes) == 3
+        assert (stats["prunes"] > 0) == prune
+    assert rootnode.visits > 0
+    rootnode = ISMCTS.Search(state, 2000, max_bytes=20000, stats=stats)
+    assert stats["peak_bytes"] <= 20000 and rootnode.tree.GetBytes() <= 20000
+
+    # a tree of Node objects, bounded in bytes
+    stats = {}
+    rootnode = ISMCTS.Search(state, 2000, rootnode=ISMCTS.Node(), max_bytes=100 * ISMCTS.NODE_BYTES, prune=True, stats=stats)
+    assert stats["peak_nodes"] <= 100 and ISMCTS.CountNodes(rootnode) <= 100
+    assert len(rootnode.childNodes) == 3
+
+    # a budget too small for the children of the root still gives a legal move
+    assert ISMCTS.ISMCTS(state, 50, verbose=0, max_nodes=1) in state.GetMoves()
+    assert ISMCTS.ISMCTSAgent(50, max_bytes=200)(state) in state.GetMoves()
+
+def testSearchStats():
+    random.seed(0)
+    state = briscola.BriscolaState(2)
+    stats = {}
+    rootnode = ISMCTS.Search(state, 300, stats=stats)
+    assert stats["iterations"] == 300 and stats["nodes"] == rootnode.tree.count
+    assert stats["phases"]["determinize"]["calls"] == 300
+    assert stats["phases"]["expand"]["calls"] == stats["nodes"] - 1
+    assert all(phase["time"] >= 0 for phase in stats["phases"].values())
+    assert sum(stats["root_visits"].values()) == 300 and stats["max_depth"] >= 1
+    assert 0 < stats["avg_rollout_length"] < 40
+
+def testZobristKeys():
+    def keys(state):
+        return state.Key(), [state.InfoSetKey(p) for p in range(1, state.numberOfPlayers + 1)]
+
+    def fresh(state):
+        st = state.Clone()
+        st.ComputeKeys()
+        return keys(st)
+
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        history = []
+        while state.GetMoves() != []:
+            history.append((keys(state), state.DoMove(random.choice(state.GetMoves()))))
+            assert keys(state) == fresh(state)
+        while history:
+            before, undo = history.pop()
+            state.UndoMove(undo)
+            assert keys(state) == before
+
+    # the information set key ignores the cards hidden from the player
+    state = briscola.BriscolaState(4)
+    state.DoMove(state.GetMoves()[0])
+    clone = state.CloneAndRandomize(2)
+    assert clone.InfoSetKey(2) == state.InfoSetKey(2) and fresh(clone) == keys(clone)
+    assert clone.Key() != state.Key() or clone.handMasks == state.handMasks
+    assert len({state.InfoSetKey(p) for p in range(1, 5)}) == 4
+
+    # equal deals give equal keys, different moves different keys
+    deck = list(range(40))
+    random.shuffle(deck)
+    a, b = briscola.BriscolaState(2, list(deck)), briscola.BriscolaState(2, list(deck))
+    assert a.Key() == b.Key()
+    a.DoMove(a.GetMoves()[0])
+    b.DoMove(b.GetMoves()[1])
+    assert a.Key() != b.Key()
+    assert len({briscola.Card(12, "C"), briscola.CARDS[briscola.Card(12, "C").id]}) == 1
+
+    # everybody knows who took the last card, so moving it to another opponent changes the information set
+    while True:
+        state = briscola.BriscolaState(4)
+        while state.stock:
+            state.DoMove(random.choice(state.GetMoves()))
+        observer, last = state.playerToMove, state.lastCardId
+        holder = next(p for p in range(1, 5) if state.handMasks[p] >> last & 1)
+        if holder != observer:
+            break
+    other = next(p for p in range(1, 5) if p not in (observer, holder))
+    swapped = state.Clone()
+    c = briscola.MaskToIds(swapped.handMasks[other])[0]
+    swapped.handMasks[holder] ^= (1 << last) | (1 << c)
+    swapped.handMasks[other] ^= (1 << last) | (1 << c)
+    swapped.ComputeKeys()
+    assert swapped.InfoSetKey(observer) != state.InfoSetKey(observer)
+    assert state.CloneAndRandomize(observer).InfoSetKey(observer) == state.InfoSetKey(observer)
+
+def testEarlyStop():
+    # a forced move is not searched
+    state = briscola.BriscolaState(2)
+    while len(state.GetMoves()) > 1:
+        state.DoMove(random.choice(state.GetMoves()))
+    stats = {}
+    start_time = time.time()
+    rootnode = ISMCTS.Search(state, timed=True, thinking_time=5, stats=stats, early_stop=True)
+    assert time.time() - start_time < 1 and rootnode.visits == 1 and stats["stopped_early"]
+
+    # the search stops when the runner-up cannot catch up
+    for _ in range(5):
+        state = briscola.BriscolaState(2)
+        stats = {}
+        rootnode = ISMCTS.Search(state, itermax=3000, stats=stats, early_stop=True)
+        visits = sorted((c.visits for c in rootnode.childNodes), reverse=True)
+        assert stats["stopped_early"] == (stats["iterations"] < 3000)
+        if stats["stopped_early"]:
+            assert visits[0] - visits[1] > 3000 - stats["iterations"]
+
+    # the budget of a game is spread over the moves, more time to the first ones
+    clock = TimeManager(10)
+    state = briscola.BriscolaState(4)
+    times = []
+    while state.GetMoves() != []:
+        if state.playerToMove == 1:
+            times.append(clock.Allocate(state))
+            clock.Update(times[-1])
+        state.DoMove(random.choice(state.GetMoves()))
+    assert times == sorted(times, reverse=True) and times[-1] == clock.min_time
+    assert abs(sum(times[:-1]) - 10) < 1e-6
+    assert clock.Allocate(briscola.BriscolaState(4)) == times[0]
+
+    agent = ISMCTS.ISMCTSAgent(game_time=1)
+    start_time = time.time()
+    state = briscola.BriscolaState(2)
+    while state.GetMoves() != []:
+        state.DoMove(agent(state) if state.playerToMove == 1 else random.choice(state.GetMoves()))
+    assert time.time() - start_time < 1.5 and agent.clock.remaining < 0.5
+
+def testTrickTables():
+    for trump in range(4):
+        state = briscola.BriscolaState(2)
+        state.trump = trump
+        for w in range(40):
+            for c in range(40):
+                if c == w:
+                    continue
+                expected = 2 if (briscola.CARD_SUITS[c] == trump and briscola.CARD_SUITS[w] != trump) \
+                    or (briscola.CARD_SUITS[c] == briscola.CARD_SUITS[w] and briscola.CARD_RANKS[c] > briscola.CARD_RANKS[w]) else 1
+                assert state.ComputeTrickWinner([(1, w), (2, c)]) == (expected, briscola.CARD_POINTS[w] + briscola.CARD_POINTS[c])
+                assert briscola.TRICK_WINNER[trump][w * 40 + c] == (c if expected == 2 else w)
+
+    # the heuristic rollouts play complete games without modifying the state
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        for _ in range(random.randrange(4 * n)):
+            state.DoMove(random.choice(state.GetMoves()))
+        before = state.Clone()
+        for epsilon in [0, 0.1, 1]:
+            result = state.DoHeuristicRollout(random, epsilon)
+            assert sum(result.score) == 120 and result.length == 40 - len(state.history)
+        assert state.handMasks == before.handMasks and state.stock == before.stock and state.score == before.score
+        assert ISMCTS.ISMCTS(state, itermax=50, verbose=0, heuristic_rollouts=True) in state.GetMoves()
+
 def main():
     testCards()
     testClosingPlayer()
+    testCardIds()
+    testRandomGame()
+    testUndoMove()
+    testRandomRollout()
+    testArrayTree()
+    testSubtreeReuse()
+    testSubtreeReuseSeats()
+    testMemoryBound()
+    testSearchStats()
+    testZobristKeys()
+    testEarlyStop()
+    testTrickTables()
     print("All tests passed")
 
 
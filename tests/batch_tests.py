@@ -0,0 +1,76 @@
+import sys
+import os
+import random
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import briscola
+import briscola_batch
+
+def testBatchRollout():
+    for n in [2, 4]:
+        states = [briscola.BriscolaState(n) for _ in range(3)]
+        for _ in range(5):
+            states[1].DoMove(random.choice(states[1].GetMoves()))
+        before = [repr(st) + str(st.stock) for st in states]
+        scores = briscola_batch.BatchRollout(states, k=50, rng=np.random.default_rng(0))
+        assert scores.shape == (150, 2)
+        assert (scores.sum(axis=1) == 120).all()
+        assert [repr(st) + str(st.stock) for st in states] == before
+
+def testBatchRolloutMatchesRollout():
+    # without shuffling the stock, both rollouts play the same game with uniformly random cards
+    random.seed(0)
+    state = briscola.BriscolaState(2)
+    for _ in range(5):
+        state.DoMove(random.choice(state.GetMoves()))
+    batch = briscola_batch.BatchResult(briscola_batch.BatchRollout([state], k=20000, shuffle_stock=False))
+    single = np.mean([state.DoRandomRollout(random).GetResult(1) for _ in range(20000)])
+    assert abs(batch.GetResult(1) - single) < 1.5
+
+def testBatchEnv():
+    rng = np.random.default_rng(0)
+    for n in [2, 4]:
+        env = briscola_batch.BatchEnv(16, n)
+        decks = np.stack([rng.permutation(40) for _ in range(16)])
+        env.reset(decks=decks)
+        states = [briscola.BriscolaState(n, deck.tolist()) for deck in decks]
+        while not env.done.all():
+            mask = env.legal_moves_mask()
+            assert mask.shape == (16, 40)
+            obs = env.observations()
+            assert obs.shape == (16, n, 40 * (n + 3) + n + 7)
+            for i, st in enumerate(states):
+                assert np.flatnonzero(mask[i]).tolist() == briscola.MaskToIds(st.handMasks[st.playerToMove])
+                assert np.flatnonzero(obs[i, 0, :40]).tolist() == briscola.MaskToIds(st.handMasks[1])
+            actions = np.array([rng.choice(np.flatnonzero(m)) for m in mask])
+            gained, done = env.step(actions)
+            for i, st in enumerate(states):
+                before = list(st.score)
+                st.DoMove(briscola.CARDS[int(actions[i])])
+                assert env.score[i].tolist() == st.score and env.player[i] == st.playerToMove
+                assert gained[i].tolist() == [a - b for a, b in zip(st.score, before)]
+                assert done[i] == (st.GetMoves() == [])
+        assert not env.legal_moves_mask().any() and (env.score.sum(axis=1) == 120).all()
+
+        # games are dealt again from seeds, the same seeds give the same games
+        env.reset(range(16))
+        hands = env.hands.copy()
+        env.reset(range(16))
+        assert (env.hands == hands).all() and not env.done.any()
+        try:
+            env.step(np.where(env.legal_moves_mask(), -1, np.arange(40)).max(axis=1))
+            assert False
+        except Exception as e:
+            assert not isinstance(e, AssertionError)
+
+def main():
+    testBatchRollout()
+    testBatchRolloutMatchesRollout()
+    testBatchEnv()
+    print("All tests passed")
+
+
+main()
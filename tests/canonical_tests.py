@@ -0,0 +1,65 @@
+import sys
+import os
+import random
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import canonical
+from agents.random_agent import RandomAgent
+from endgame import EndgameSolver
+
+def GetState(n, rng):
+    random.seed(rng.getrandbits(64))
+    state = briscola.BriscolaState(n)
+    for _ in range(rng.randrange(40)):
+        state.DoMove(rng.choice(state.GetMoves()))
+    return state
+
+def testPermutations():
+    rng = random.Random(0)
+    for _ in range(50):
+        state = GetState(rng.choice([2, 4]), rng)
+        # relabel the non-trump suits at random
+        others = [suit for suit in range(4) if suit != state.trump]
+        shuffled = rng.sample(others, 3)
+        perm = tuple(suit if suit == state.trump else shuffled[others.index(suit)] for suit in range(4))
+        relabelled = canonical.PermuteState(state, perm)
+        assert relabelled.trump == state.trump
+        assert canonical.StateKey(relabelled) == canonical.StateKey(state)
+        assert canonical.InfoSetKey(relabelled, 1) == canonical.InfoSetKey(state, 1)
+        inverse = canonical.InversePermutation(perm)
+        assert canonical.PermuteState(relabelled, inverse).handMasks == state.handMasks
+
+        canonicalState, perm = canonical.CanonicalState(state)
+        assert canonicalState.trump == 0
+        assert [canonical.PermuteCard(c, perm) for c in state.history] == canonicalState.history
+
+def testSolverSymmetry():
+    rng = random.Random(1)
+    solver = EndgameSolver(symmetry=True)
+    plain = EndgameSolver(symmetry=False)
+    for _ in range(20):
+        state = GetState(2, rng)
+        while state.stock:
+            state.DoMove(rng.choice(state.GetMoves()))
+        if state.GetMoves() != []:
+            assert solver.Solve(state) == plain.Solve(state)
+
+def testCanonicalAgent():
+    rng = random.Random(2)
+    agent = canonical.CanonicalAgent(RandomAgent)
+    for _ in range(20):
+        state = GetState(4, rng)
+        if state.GetMoves() != []:
+            assert agent(state) in state.GetMoves()
+
+def main():
+    testPermutations()
+    testSolverSymmetry()
+    testCanonicalAgent()
+    print("All tests passed")
+
+
+main()
@@ -0,0 +1,99 @@
+import sys
+import os
+import random
+import numpy as np
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import agents.ISMCTS as ISMCTS
+from determinization import CurrentTrickWeight, DeterminizationPool
+
+def testPoolConsistency():
+    for n in (2, 4):
+        random.seed(n)
+        state = briscola.BriscolaState(n)
+        pools = {p: DeterminizationPool(32, weight=CurrentTrickWeight() if p == 1 else None) for p in range(1, n + 1)}
+        while state.GetMoves():
+            observer = state.playerToMove
+            pool = pools[observer]
+            pool.Sync(state)
+            for _ in range(40): # more than the rows of the pool, so a new batch is dealt
+                sample = state.Clone()
+                pool.Randomize(sample)
+                assert sample.InfoSetKey(observer) == state.InfoSetKey(observer)
+                assert len(sample.stock) == len(state.stock)
+                hidden = 0
+                for p in range(1, n + 1):
+                    assert sample.handMasks[p].bit_count() == state.handMasks[p].bit_count()
+                    assert sample.handMasks[p] & state.publicMask == state.handMasks[p] & state.publicMask
+                    assert sample.handKeys[p] == sample.HandKey(p)
+                    hidden |= sample.handMasks[p] & ~state.publicMask
+                for c in sample.stock:
+                    hidden |= 1 << c
+                assert hidden == briscola.FULL_MASK & ~state.publicMask
+            state.DoMove(random.choice(state.GetMoves()))
+        # the rows are carried over the whole game
+        assert all(pool.reused > 0 and pool.exchanged > 0 for pool in pools.values())
+
+def testPoolUniform():
+    random.seed(3)
+    state = briscola.BriscolaState(2)
+    pool = DeterminizationPool(20000)
+    while len(state.history) < 16 or state.playerToMove != 1:
+        if state.playerToMove == 1:
+            pool.Sync(state)
+        state.DoMove(random.choice(state.GetMoves()))
+    pool.Sync(state)
+    assert pool.dealt == 1
+    # every unseen card is in the hand of the opponent or on top of the stock as often as the others
+    unseen = briscola.MaskToIds(state.GetUnseenMask(1))
+    inHand = (pool.owner[:, unseen] == 2).mean(axis=0)
+    assert np.abs(inHand - 3 / len(unseen)).max() < 0.02
+    onTop = np.bincount(np.array(pool.stocks)[:, -1], minlength=40)[unseen] / len(pool.stocks)
+    assert np.abs(onTop - 1 / len(unseen)).max() < 0.015
+
+def testWeightAndConstraint():
+    random.seed(5)
+    state = briscola.BriscolaState(2)
+    state.DoMove(random.choice(state.GetMoves()))
+    card = briscola.MaskToIds(state.GetUnseenMask(2))[0]
+    pool = DeterminizationPool(64, constraint=lambda pool, state: pool.owner[:, card] == 1)
+    pool.Sync(state)
+    for _ in range(100):
+        sample = state.Clone()
+        pool.Randomize(sample)
+        assert sample.handMasks[1] >> card & 1
+
+    # with epsilon 0 only the hands from which the greedy policy plays the card on the table are handed out
+    pool = DeterminizationPool(64, weight=CurrentTrickWeight(epsilon=0))
+    pool.Sync(state)
+    (player, played), = state.trick
+    for _ in range(100):
+        sample = state.Clone()
+        pool.Randomize(sample)
+        hand = sample.handMasks[player] | 1 << played
+        assert briscola.HeuristicCard(hand, state.trump, False, None, 0) == played
+
+def testSearch():
+    random.seed(7)
+    state = briscola.BriscolaState(2)
+    move = ISMCTS.ISMCTS(state, 200, verbose=0, sampler=DeterminizationPool())
+    assert move in state.GetMoves()
+    agent = ISMCTS.ISMCTSAgent(100, sampler=DeterminizationPool(weight=CurrentTrickWeight()))
+    while state.GetMoves():
+        move = agent(state) if state.playerToMove == 1 else random.choice(state.GetMoves())
+        assert move in state.GetMoves()
+        state.DoMove(move)
+    assert agent.sampler.dealt == 1
+
+def main():
+    testPoolConsistency()
+    testPoolUniform()
+    testWeightAndConstraint()
+    testSearch()
+    print("All tests passed")
+
+
+main()
@@ -0,0 +1,59 @@
+import sys
+import os
+import random
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import agents.ISMCTS as ISMCTS
+from endgame import EndgameSolver
+
+def GetEndgame(n, seed):
+    """ Return a state of a random game with n players right after the last deal.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    state = briscola.BriscolaState(n)
+    while state.stock or state.trick:
+        state.DoMove(rng.choice(state.GetMoves()))
+    for _ in range(rng.randrange(n)):
+        state.DoMove(rng.choice(state.GetMoves()))
+    return state
+
+def Minimax(state):
+    """ Final scores [even, odd] with perfect play, by plain minimax.
+    """
+    if state.GetMoves() == []:
+        return list(state.score)
+    team = state.playerToMove % 2
+    results = []
+    for m in state.GetMoves():
+        st = state.Clone()
+        st.DoMove(m)
+        results.append(Minimax(st))
+    return max(results, key=lambda score: score[team])
+
+def testSolve():
+    solver = EndgameSolver()
+    for n in (2, 4):
+        for seed in range(20):
+            state = GetEndgame(n, seed)
+            assert solver.Solve(state) == Minimax(state)
+            assert solver(state).score == Minimax(state)
+    assert solver.hits > 0
+    assert solver(briscola.BriscolaState(2)) is None
+
+def testEvaluator():
+    random.seed(0)
+    state = GetEndgame(2, 1)
+    rootnode = ISMCTS.Search(state, 100, evaluator=EndgameSolver())
+    assert rootnode.visits == 100
+
+def main():
+    testSolve()
+    testEvaluator()
+    print("All tests passed")
+
+
+main()
@@ -0,0 +1,54 @@
+import sys
+import os
+import tempfile
+from functools import partial
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import agents.ISMCTS as ISMCTS
+from agents.random_agent import RandomAgent
+from run_experiment import run_experiment, LoadRecords
+
+AGENTS = {
+    1: partial(ISMCTS.ISMCTS, itermax=10, verbose=0),
+    2: RandomAgent,
+}
+
+def testResume():
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("games.jsonl", "games.csv"):
+            output = os.path.join(tmp, name)
+            run_experiment(AGENTS, n_games=4, seed=7, output=output)
+            # simulate a crash in the middle of writing a record
+            with open(output, "a") as f:
+                f.write('{"game": 4, "mas')
+            resumed = run_experiment(AGENTS, n_games=8, seed=7, output=output)
+            records = LoadRecords(output)
+            assert sorted(r["game"] for r in records) == list(range(8))
+
+            # the same games as a parallel run from scratch
+            parallel = os.path.join(tmp, "parallel_" + name)
+            assert run_experiment(AGENTS, n_games=8, seed=7, workers=2, output=parallel) == resumed
+            byGame = {r["game"]: r for r in LoadRecords(parallel)}
+            for r in records:
+                assert r["seed"] == byGame[r["game"]]["seed"]
+                assert (r["points_1"], r["points_2"]) == (byGame[r["game"]]["points_1"], byGame[r["game"]]["points_2"])
+
+def testMoveStats():
+    agents = {1: ISMCTS.ISMCTSAgent(itermax=10, collect_stats=True), 2: RandomAgent}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("games.jsonl", "games.csv"):
+            output = os.path.join(tmp, name)
+            run_experiment(agents, n_games=2, seed=1, output=output, collect_stats=True)
+            for record in LoadRecords(output):
+                assert len(record["move_stats"]) == 20
+                assert all(s["player"] == 1 and s["iterations"] == 10 for s in record["move_stats"])
+
+def main():
+    testResume()
+    testMoveStats()
+    print("All tests passed")
+
+
+main()
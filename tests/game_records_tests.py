@@ -0,0 +1,118 @@
+import sys
+import os
+import contextlib
+import io
+import json
+import random
+import tempfile
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+from agents.random_agent import RandomAgent
+from game_records import RecordReader, RecordWriter
+from run_experiment import run_experiment
+
+def testRecords():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "games.brg")
+        output = os.path.join(tmp, "games.jsonl")
+        agents = {p: RandomAgent for p in range(1, 5)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            winners, _ = run_experiment(agents, n_games=6, seed=3, output=output, game_records=path)
+
+        reader = RecordReader(path)
+        assert len(reader) == 6 and reader.agentNames == ["RandomAgent"] * 4
+        assert sum(record.winner == 1 for record in reader) == winners[1]
+        for record in reader:
+            assert len(record.moves) == 40 and sorted(record.deck) == list(range(40))
+            final = record.State()
+            assert final.score == record.score and final.GetMoves() == []
+            # the intermediate states match a replay of the game move by move
+            ply = random.randrange(40)
+            state = briscola.BriscolaState(4, record.deck)
+            for c in record.moves[:ply]:
+                state.DoMove(briscola.CARDS[c])
+            assert record.State(ply).Key() == state.Key()
+            assert [move for _, move in record.States()] == [briscola.CARDS[c] for c in record.moves] + [None]
+        assert reader[-1].game == reader[5].game
+        reader.Close()
+
+        # several writers append to the same file, a record cut short at the end is ignored
+        first, second = RecordWriter(path, 4), RecordWriter(path, 4)
+        first.Write(10, 1, [60, 60], 0, list(range(40)), [0, 1])
+        second.Write(11, 2, [0, 0], 0, list(range(40)), [])
+        first.Close()
+        second.Close()
+        with open(path, "ab") as f:
+            f.write(b"\0" * 10)
+        reader = RecordReader(path)
+        assert len(reader) == 8 and reader[6].moves == [0, 1] and reader[7].game == 11
+        reader.Close()
+        try:
+            RecordWriter(path, 2)
+            assert False
+        except Exception as e:
+            assert not isinstance(e, AssertionError)
+
+def testPartialRecord():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "games.brg")
+        # an empty file gets a header
+        open(path, "wb").close()
+        with RecordWriter(path, 2, ["a", "b"]) as writer:
+            writer.Write(0, 10, [60, 60], 0, list(range(40)), [0, 1])
+        # a crash in the middle of a record
+        with open(path, "ab") as f:
+            f.write(b"\x01" * 30)
+        with RecordWriter(path, 2) as writer:
+            writer.Write(1, 11, [70, 50], 2, list(range(40)), [2, 3, 4])
+            writer.Write(2, 12, [50, 70], 1, list(range(40)), [])
+        reader = RecordReader(path)
+        assert reader.agentNames == ["a", "b"] and len(reader) == 3
+        assert [(r.game, r.seed, r.score, r.moves) for r in reader] == \
+            [(0, 10, [60, 60], [0, 1]), (1, 11, [70, 50], [2, 3, 4]), (2, 12, [50, 70], [])]
+        reader.Close()
+
+def testResume():
+    agents = {p: RandomAgent for p in range(1, 3)}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # without output, the games already in the record file are not played again
+        path = os.path.join(tmp, "games.brg")
+        run_experiment(agents, n_games=4, seed=5, game_records=path)
+        resumed = run_experiment(agents, n_games=6, seed=5, game_records=path)
+        reader = RecordReader(path)
+        assert sorted(record.game for record in reader) == list(range(6))
+        reader.Close()
+        assert run_experiment(agents, n_games=6, seed=5) == resumed
+        try:
+            run_experiment(agents, n_games=6, seed=6, game_records=path)
+            assert False
+        except Exception as e:
+            assert not isinstance(e, AssertionError)
+
+        # a crash after writing the record of a game but not its line of output
+        path = os.path.join(tmp, "games2.brg")
+        output = os.path.join(tmp, "games.jsonl")
+        run_experiment(agents, n_games=4, seed=5, output=output, game_records=path)
+        with open(output) as f:
+            lines = f.readlines()
+        with open(output, "w") as f:
+            f.writelines(lines[:-1])
+        assert run_experiment(agents, n_games=4, seed=5, output=output, game_records=path) == \
+            run_experiment(agents, n_games=4, seed=5)
+        reader = RecordReader(path)
+        assert sorted(record.game for record in reader) == list(range(4))
+        reader.Close()
+        with open(output) as f:
+            assert sorted(json.loads(line)["game"] for line in f) == list(range(4))
+
+def main():
+    testRecords()
+    testPartialRecord()
+    testResume()
+    print("All tests passed")
+
+
+main()
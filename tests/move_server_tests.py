@@ -0,0 +1,118 @@
+import sys
+import os
+import asyncio
+import json
+import random
+import tempfile
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+from move_server import InfoSet, MoveServer, StateFromInfoSet
+
+def testInfoSet():
+    for n in [2, 4]:
+        state = briscola.BriscolaState(n)
+        while state.GetMoves() != []:
+            p = state.playerToMove
+            request = InfoSet(state, p)
+            rebuilt = StateFromInfoSet(n, p, request["hand"], request["last_card"], request["history"])
+            assert rebuilt.InfoSetKey(p) == state.InfoSetKey(p)
+            assert rebuilt.publicMask == state.publicMask and len(rebuilt.stock) == len(state.stock)
+            assert [m.bit_count() for m in rebuilt.handMasks] == [m.bit_count() for m in state.handMasks]
+            assert all(rebuilt.handMasks[q] & state.publicMask == state.handMasks[q] & state.publicMask for q in range(1, n + 1))
+            state.DoMove(random.choice(state.GetMoves()))
+
+    # player 2 is not to move, player 1 has 3 cards, cards are played once
+    state = briscola.BriscolaState(2)
+    hand1, hand2 = briscola.MaskToIds(state.handMasks[1]), briscola.MaskToIds(state.handMasks[2])
+    for p, hand, history in [(2, hand2, []), (1, hand1[:2], []), (1, hand1, [hand2[0], hand2[0]])]:
+        try:
+            StateFromInfoSet(2, p, hand, state.lastCardId, history)
+            assert False
+        except Exception as e:
+            assert not isinstance(e, AssertionError)
+
+async def Priority():
+    # with one worker the queued requests are served by increasing time left
+    server = MoveServer(workers=1, default_deadline=0.1, seed=0)
+    await server.Start()
+    order = []
+    async def Request(i, timeLeft):
+        state = briscola.BriscolaState(2)
+        response = await server.Submit(InfoSet(state, 1, id=i, time_left=timeLeft))
+        assert response["id"] == i and response["move"] in briscola.MaskToIds(state.handMasks[1])
+        order.append(i)
+    first = asyncio.create_task(Request(0, 0))
+    await asyncio.sleep(0.02)
+    await asyncio.gather(first, Request(3, 30), Request(1, 10), Request(2, 20))
+    await server.Close()
+    assert order == [0, 1, 2, 3] and server.served == 4
+
+async def PlayGames(path, games, server):
+    """ Play games 2 player games at once against the server through the Unix socket path.
+    """
+    async def Game(g):
+        reader, writer = await asyncio.open_unix_connection(path)
+        state = briscola.BriscolaState(2)
+        while state.GetMoves() != []:
+            if state.playerToMove == 1:
+                writer.write((json.dumps(InfoSet(state, 1, id=g, deadline=0.1)) + "\n").encode())
+                response = json.loads(await reader.readline())
+                assert response["id"] == g
+                state.DoMove(briscola.CARDS[response["move"]])
+            else:
+                state.DoMove(random.choice(state.GetMoves()))
+        # an invalid request gets an error
+        writer.write(b'{"id": 1}\n')
+        assert "error" in json.loads(await reader.readline())
+        writer.close()
+        return sum(state.score)
+
+    serving = asyncio.create_task(server.Serve(path=path))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    scores = await asyncio.gather(*[Game(g) for g in range(games)])
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+    return scores
+
+async def Malformed(path, server):
+    """ Send requests with invalid deadline or time_left and check that they get an error without
+        blocking the requests that follow them.
+    """
+    serving = asyncio.create_task(server.Serve(path=path))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    reader, writer = await asyncio.open_unix_connection(path)
+    state = briscola.BriscolaState(2)
+    for fields in [{"deadline": None}, {"deadline": float("inf")}, {"time_left": "soon"}, {"time_left": True}] * 2:
+        writer.write((json.dumps(InfoSet(state, 1, id=0, **fields)) + "\n").encode())
+        assert "error" in json.loads(await reader.readline())
+    for i in range(3):
+        writer.write((json.dumps(InfoSet(state, 1, id=i, deadline=0.05, time_left=i)) + "\n").encode())
+    responses = [json.loads(await reader.readline()) for _ in range(3)]
+    assert sorted(r["id"] for r in responses) == [0, 1, 2] and all("move" in r for r in responses)
+    writer.close()
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+def testServer():
+    asyncio.run(Priority())
+    with tempfile.TemporaryDirectory() as tmp:
+        server = MoveServer(workers=1, max_pending=1, default_deadline=0.1, seed=0)
+        asyncio.run(Malformed(os.path.join(tmp, "moves.sock"), server))
+        assert server.errors == 8 and server.served == 3
+    with tempfile.TemporaryDirectory() as tmp:
+        server = MoveServer(workers=2, max_pending=2, default_deadline=0.1, seed=0)
+        assert asyncio.run(PlayGames(os.path.join(tmp, "moves.sock"), 6, server)) == [120] * 6
+        assert server.served == 6 * 20 and server.errors == 6
+
+def main():
+    testInfoSet()
+    testServer()
+    print("All tests passed")
+
+
+main()
@@ -0,0 +1,61 @@
+import sys
+import os
+import pickle
+import random
+import tempfile
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import canonical
+from opening_book import BookAgent, Build, BuildWorker, OpeningBook
+
+def NoSearch(state):
+    raise Exception("The book should have answered")
+
+def testBook():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "opening.book")
+        Build(path, n=2, tricks=2, deals=4, itermax=20, verbose=False)
+        book = OpeningBook(path, cacheSize=4)
+        assert 0 < len(book) <= 16
+
+        # the deals of the book are answered without searching, in every labelling of the suits
+        for i in range(4):
+            seed = random.Random(f"0:{i}").getrandbits(64)
+            rng = random.Random(seed)
+            deck = list(range(40))
+            rng.shuffle(deck)
+            state = briscola.BriscolaState(2, deck)
+            agent = BookAgent(book, NoSearch)
+            while book.Covers(state):
+                others = [suit for suit in range(4) if suit != state.trump]
+                shuffled = random.sample(others, 3)
+                perm = tuple(suit if suit == state.trump else shuffled[others.index(suit)] for suit in range(4))
+                relabelled = canonical.PermuteState(state, perm)
+                move = agent(state)
+                assert agent(relabelled).id == canonical.PermuteCard(move.id, perm)
+                state.DoMove(move)
+            assert agent.hits == 8 and agent.misses == 0
+        assert len(book.cache) <= 4
+
+        # other deals fall back to the wrapped agent
+        state = briscola.BriscolaState(4)
+        agent = BookAgent(book, lambda state: state.GetMoves()[0])
+        assert agent(state) == state.GetMoves()[0] and agent.hits == 0 and agent.misses == 0
+
+        # building again with new deals adds to the book
+        Build(path, n=2, tricks=2, deals=2, itermax=20, seed=1, verbose=False)
+        bigger = pickle.loads(pickle.dumps(OpeningBook(path)))
+        assert len(bigger) > len(book)
+        assert all(bigger.Get(key) == move for key, move in BuildWorker((2, 1, 20, random.Random("1:0").getrandbits(64))))
+        bigger.Close()
+        book.Close()
+
+def main():
+    testBook()
+    print("All tests passed")
+
+
+main()
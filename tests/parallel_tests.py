@@ -0,0 +1,47 @@
+import sys
+import os
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import agents.ISMCTS as ISMCTS
+
+def testRootParallel():
+    state = briscola.BriscolaState(2)
+    workers, itermax = 2, 301
+    for pool in (multiprocessing.Pool(workers), ProcessPoolExecutor(workers)):
+        random.seed(0)
+        rootnode = ISMCTS.ParallelSearch(state, itermax, workers=workers, pool=pool)
+
+        # the same searches in this process, with the seeds drawn by ParallelSearch
+        random.seed(0)
+        seeds = [random.getrandbits(64) for _ in range(workers)]
+        expected = {}
+        for w, iters in enumerate([151, 150]):
+            args = (state, iters, False, 1, False, 0, None, None, None, False, None, 0.7, None, False, False, None)
+            for move, player, wins, visits, avails in ISMCTS.SearchWorker((seeds[w], args)):
+                total = expected.setdefault(move, [0, 0, 0])
+                total[0] += wins
+                total[1] += visits
+                total[2] += avails
+
+        assert rootnode.visits == itermax == sum(c.visits for c in rootnode.childNodes)
+        assert {c.move: [c.wins, c.visits, c.avails] for c in rootnode.childNodes} == expected
+        assert all(c.playerJustMoved == 1 for c in rootnode.childNodes)
+        assert ISMCTS.BestMove(rootnode, state) in state.GetMoves()
+        if isinstance(pool, ProcessPoolExecutor):
+            pool.shutdown()
+        else:
+            pool.close()
+            pool.join()
+
+def main():
+    testRootParallel()
+    print("All tests passed")
+
+
+main()
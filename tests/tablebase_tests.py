@@ -0,0 +1,49 @@
+import sys
+import os
+import pickle
+import random
+import tempfile
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+from endgame import EndgameSolver
+from tablebase import Generate, Tablebase
+
+def GetEndgame(rng, cards):
+    """ Return a state of a random 2 player game with at most cards cards in the hand of the player to move.
+    """
+    random.seed(rng.getrandbits(64))
+    state = briscola.BriscolaState(2)
+    while state.stock or state.handMasks[state.playerToMove].bit_count() > cards:
+        state.DoMove(rng.choice(state.GetMoves()))
+    return state
+
+def testTablebase():
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "endgame.tb")
+        Generate(path, maxCards=1, verbose=False)
+        tablebase = Tablebase(path)
+        solver = EndgameSolver()
+        for _ in range(200):
+            state = GetEndgame(rng, 1)
+            assert tablebase(state).score == solver.Solve(state)
+
+        # the solver looks up the last trick in the tablebase
+        withTable = EndgameSolver(tablebase=pickle.loads(pickle.dumps(tablebase)))
+        for _ in range(100):
+            state = GetEndgame(rng, 3)
+            assert tablebase(state) is None or state.handMasks[state.playerToMove].bit_count() <= 1
+            assert withTable.Solve(state) == solver.Solve(state)
+        assert withTable.hits > 0
+        withTable.tablebase.Close()
+        tablebase.Close()
+
+def main():
+    testTablebase()
+    print("All tests passed")
+
+
+main()
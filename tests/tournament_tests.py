@@ -0,0 +1,41 @@
+import sys
+import os
+import random
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+from agents.random_agent import RandomAgent
+import tournament
+
+def testMirroredDeal():
+    deck = list(range(40))
+    random.Random(3).shuffle(deck)
+    a = briscola.BriscolaState(2, deck)
+    b = briscola.BriscolaState(2, deck)
+    assert a.handMasks == b.handMasks and a.stock == b.stock and a.lastCardId == b.lastCardId
+
+def testElo():
+    assert abs(tournament.ScoreToElo(tournament.EloToScore(120)) - 120) < 1e-6
+    p = tournament.Pairing("a", "b")
+    for _ in range(20):
+        p.Add([1.0, 0.5])
+    elo, low, high = p.EloInterval()
+    assert low < elo < high and elo > 0
+    assert p.LLR(0, 50) > 0
+
+def testSPRT():
+    configs = {"ismcts": {"itermax": 50}, "random": RandomAgent}
+    pairings = tournament.RunTournament(configs, mode="gauntlet", baseline="random", max_pairs=50, verbose=False)
+    assert len(pairings) == 1 and pairings[0].status == "H1"
+    assert pairings[0].Games() < 100
+
+def main():
+    testMirroredDeal()
+    testElo()
+    testSPRT()
+    print("All tests passed")
+
+
+main()
@@ -0,0 +1,69 @@
+import sys
+import os
+import multiprocessing
+import random
+import time
+
+# Add the directory containing briscola.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import briscola
+import agents.tree_parallel as tree_parallel
+
+def testIterations():
+    random.seed(0)
+    state = briscola.BriscolaState(2)
+    rootnode = tree_parallel.TreeParallelSearch(state, 400, workers=2)
+    assert rootnode.visits == 400 and sum(c.visits for c in rootnode.childNodes) == 400
+    assert tree_parallel.TreeParallelISMCTS(state, 100, verbose=0, workers=2) in state.GetMoves()
+
+def testCapacity():
+    # a tree too small for the search is not grown further, but the search ends
+    random.seed(1)
+    state = briscola.BriscolaState(4)
+    rootnode = tree_parallel.TreeParallelSearch(state, 300, workers=2, capacity=5)
+    assert rootnode.visits == 300 and rootnode.nodeCount <= 5
+    assert tree_parallel.TreeParallelISMCTS(state, 300, verbose=0, workers=2, capacity=5) in state.GetMoves()
+
+def testTimed():
+    random.seed(2)
+    state = briscola.BriscolaState(2)
+    start_time = time.time()
+    rootnode = tree_parallel.TreeParallelSearch(state, timed=True, thinking_time=0.3, workers=2)
+    assert time.time() - start_time < 0.6 and rootnode.visits > 0
+
+def testLockFree():
+    # run the workers by hand to look at the shared tree before it is released
+    random.seed(3)
+    state = briscola.BriscolaState(2)
+    capacity, workers = 10000, 2
+    for lockFree in (False, True):
+        shards = workers if lockFree else 1
+        tree = tree_parallel.SharedTree(capacity, state.GetMoveId, state.GetMoveFromId, shards=shards)
+        locks = [] if lockFree else [multiprocessing.Lock() for _ in range(8)]
+        processes = [multiprocessing.Process(target=tree_parallel.TreeWorker,
+                                             args=(tree.GetNames(), capacity, shards, locks, multiprocessing.Lock(),
+                                                   state, 300, None, False, 0.7, 1, random.getrandbits(64),
+                                                   w if lockFree else 0))
+                     for w in range(workers)]
+        for proc in processes:
+            proc.start()
+        for proc in processes:
+            proc.join()
+            assert proc.exitcode == 0
+        assert min(tree.virtual) == 0 and max(tree.virtual) == 0
+        rootnode = tree.ToNode(0, depth=2)
+        assert rootnode.visits == 600 and sum(c.visits for c in rootnode.childNodes) == 600
+        for child in rootnode.childNodes:
+            assert sum(c.visits for c in child.childNodes) <= child.visits
+        tree.Close()
+
+def main():
+    testIterations()
+    testCapacity()
+    testTimed()
+    testLockFree()
+    print("All tests passed")
+
+
+main()
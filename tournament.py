@@ -0,0 +1,199 @@
+""" Tournaments between named agent configurations.
+    Every pairing is played in mirrored pairs of games: the same shuffled deck is dealt twice with the
+    two configurations swapping seats, so the luck of the deal cancels out within the pair.
+    After every round the pairings run an SPRT (sequential probability ratio test) on the Elo difference
+    and stop as soon as it is decided, or after max_pairs pairs.
+"""
+import agents.ISMCTS as ISMCTS
+from run_experiment import PlayGame
+from functools import partial
+from math import log, log10, sqrt
+import argparse
+import itertools
+import multiprocessing
+import random
+
+
+def ScoreToElo(score):
+    """ Return the Elo difference corresponding to an expected score (0 to 1).
+    """
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * log10(1 / score - 1)
+
+def EloToScore(elo):
+    """ Return the expected score against an opponent elo points weaker.
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def MakeAgent(config):
+    """ Return an agent for a configuration: a dict of keyword arguments for ISMCTS.ISMCTS,
+        or already an agent (any callable taking the state and returning a move).
+    """
+    if isinstance(config, dict):
+        return partial(ISMCTS.ISMCTS, **{"verbose": 0, **config})
+    return config
+
+def DealSeed(seed, a, b, pair):
+    """ Return the seed of mirrored pair number pair of the pairing between a and b.
+    """
+    return random.Random(f"{seed}:{a}:{b}:{pair}").getrandbits(64)
+
+def PlayMirroredPair(args):
+    """ Play two games between the configurations a and b on the same deck, a playing the odd seats in the first
+        game and the even seats in the second one. Return the scores of a in the two games (1 win, 0.5 draw, 0 loss).
+    """
+    n, a, b, seed = args
+    rng = random.Random(seed)
+    deck = list(range(40))
+    rng.shuffle(deck)
+
+    results = []
+    for seat, (first, second) in ((1, (a, b)), (2, (b, a))):
+        random.seed(rng.getrandbits(64))
+        agents = {p: MakeAgent(first if p % 2 == 1 else second) for p in range(1, n + 1)}
+        winners = {p: 0 for p in range(1, n + 1)}
+        scores = {p: 0 for p in range(1, n + 1)}
+        state = PlayGame(n, agents, winners, scores, deck=deck)
+        results.append(1.0 if winners[seat] else (0.5 if state.score[0] == state.score[1] else 0.0))
+    return results
+
+
+class Pairing:
+    """ The results of configuration a against configuration b.
+        Every sample is the average score of a over a mirrored pair of games.
+    """
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.samples = []
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.status = None # None while running, then "H0", "H1" or "max"
+
+    def Add(self, results):
+        """ Add the scores of a in the two games of a mirrored pair.
+        """
+        for r in results:
+            self.wins += r == 1.0
+            self.draws += r == 0.5
+            self.losses += r == 0.0
+        self.samples.append(sum(results) / len(results))
+
+    def Games(self):
+        return self.wins + self.draws + self.losses
+
+    def Score(self):
+        """ Return the average score of a.
+        """
+        return sum(self.samples) / len(self.samples) if self.samples else 0.5
+
+    def Variance(self):
+        """ Return the variance of the pair scores, bounded away from 0.
+        """
+        mean = self.Score()
+        n = len(self.samples)
+        var = sum((x - mean) ** 2 for x in self.samples) / (n - 1) if n > 1 else 0.0
+        return max(var, 1e-3)
+
+    def EloInterval(self, z=1.96):
+        """ Return the Elo difference of a over b and its confidence interval (low, high), with z standard errors.
+        """
+        score = self.Score()
+        error = z * sqrt(self.Variance() / max(len(self.samples), 1))
+        return ScoreToElo(score), ScoreToElo(score - error), ScoreToElo(score + error)
+
+    def LLR(self, elo0, elo1):
+        """ Return the log-likelihood ratio of H1 (a is elo1 stronger) against H0 (a is elo0 stronger),
+            with the normal approximation of the distribution of the pair scores.
+        """
+        s0, s1 = EloToScore(elo0), EloToScore(elo1)
+        n = len(self.samples)
+        return n * (s1 - s0) * (2 * self.Score() - s0 - s1) / (2 * self.Variance())
+
+    def Update(self, elo0, elo1, alpha, beta, max_pairs, min_pairs=4):
+        """ Stop the pairing if the SPRT accepts one of the hypotheses or max_pairs pairs have been played.
+        """
+        llr = self.LLR(elo0, elo1)
+        if len(self.samples) >= min_pairs and llr >= log((1 - beta) / alpha):
+            self.status = "H1"
+        elif len(self.samples) >= min_pairs and llr <= log(beta / (1 - alpha)):
+            self.status = "H0"
+        elif len(self.samples) >= max_pairs:
+            self.status = "max"
+
+    def __repr__(self):
+        elo, low, high = self.EloInterval()
+        return "%s vs %s: %4i games +%i =%i -%i score %4.2f elo %+6.1f [%+6.1f, %+6.1f] %s" % (
+            self.a, self.b, self.Games(), self.wins, self.draws, self.losses,
+            self.Score(), elo, low, high, self.status or "running",
+        )
+
+
+def Schedule(names, mode="round-robin", baseline=None):
+    """ Return the list of pairings (a, b) to play: every pair of names for a round-robin,
+        baseline against every other name for a gauntlet.
+    """
+    if mode == "round-robin":
+        return list(itertools.combinations(names, 2))
+    elif mode == "gauntlet":
+        if baseline not in names:
+            raise Exception(f"Unknown baseline {baseline}")
+        return [(name, baseline) for name in names if name != baseline]
+    raise Exception(f"Unknown tournament mode {mode}")
+
+def RunTournament(configs, mode="round-robin", baseline=None, players=2, max_pairs=100, elo0=0, elo1=50,
+                  alpha=0.05, beta=0.05, workers=1, batch=None, seed=0, verbose=True):
+    """ Play a tournament between configs, a dict {name: configuration} (see MakeAgent), and return the
+        list of Pairing. Every round plays batch mirrored pairs (default: workers) for each running pairing,
+        then tests H0: a is elo0 stronger than b against H1: a is elo1 stronger than b with error rates alpha and beta.
+        With workers > 1 the pairs are spread over a pool of processes, so the configurations must be picklable.
+    """
+    if batch is None:
+        batch = max(workers, 1)
+    pairings = [Pairing(a, b) for a, b in Schedule(list(configs), mode, baseline)]
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        while any(p.status is None for p in pairings):
+            running = [p for p in pairings if p.status is None]
+            tasks = [(players, configs[p.a], configs[p.b], DealSeed(seed, p.a, p.b, len(p.samples) + i))
+                     for p in running for i in range(batch)]
+            results = pool.map(PlayMirroredPair, tasks) if pool is not None else list(map(PlayMirroredPair, tasks))
+            for i, p in enumerate(running):
+                for r in results[i * batch:(i + 1) * batch]:
+                    p.Add(r)
+                p.Update(elo0, elo1, alpha, beta, max_pairs)
+                if verbose and p.status is not None:
+                    print(p)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if verbose:
+        print("Results:")
+        for p in pairings:
+            print(p)
+    return pairings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, help='number of players (default:2)', default=2, choices=[2, 4])
+    parser.add_argument('--mode', type=str, help='round-robin or gauntlet (default:round-robin)', default="round-robin", choices=["round-robin", "gauntlet"])
+    parser.add_argument('--baseline', type=str, help='baseline configuration of a gauntlet (default:itermax100)', default="itermax100")
+    parser.add_argument('--pairs', type=int, help='maximum number of mirrored pairs per pairing (default:100)', default=100)
+    parser.add_argument('--elo0', type=float, help='Elo difference of H0 (default:0)', default=0)
+    parser.add_argument('--elo1', type=float, help='Elo difference of H1 (default:50)', default=50)
+    parser.add_argument('--workers', type=int, help='number of processes playing games (default:1)', default=1)
+    parser.add_argument('--seed', type=int, help='random seed (default:0)', default=0)
+    args = parser.parse_args()
+
+    configs = {
+        "itermax100": {"itermax": 100},
+        "itermax400": {"itermax": 400},
+        "points400": {"itermax": 400, "consider_points": True},
+        "explore1.0": {"itermax": 400, "exploration": 1.0},
+        "heuristic400": {"itermax": 400, "heuristic_rollouts": True},
+    }
+    RunTournament(configs, args.mode, args.baseline, args.players, args.pairs, args.elo0, args.elo1,
+                  workers=args.workers, seed=args.seed)